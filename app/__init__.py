@@ -1,7 +1,8 @@
 from flask import Flask
 from .config import Config
-from .extensions import db, jwt, migrate, limiter, cors
+from .extensions import db, jwt, migrate, limiter, cors, embeddings, llm
 from .routes import auth, files_bp, book_bp, subscriber_bp, ask_bp, main_bp
+from .commands import register_commands
 from flask_cors import CORS
 # import os
 # import sys
@@ -21,6 +22,8 @@ def create_app():
     migrate.init_app(app, db)
     limiter.init_app(app)
     cors.init_app(app)
+    embeddings.init_app(app)
+    llm.init_app(app)
     CORS(app)
     CORS(app, supports_credentials=True, resources={r"/*": {"origins": "*"}})
     app.register_blueprint(auth, url_prefix='/auth')
@@ -29,5 +32,6 @@ def create_app():
     app.register_blueprint(subscriber_bp, url_prefix="/subscribe")
     app.register_blueprint(ask_bp, url_prefix="/ask")
     app.register_blueprint(main_bp, url_prefix="")
+    register_commands(app)
 
     return app
@@ -0,0 +1,168 @@
+import multiprocessing
+import os
+
+import click
+import faiss
+import numpy as np
+from flask import current_app
+
+from .extensions import embeddings
+from .ingest import run_worker
+from .utils.chunk_store import ChunkStore, convert_chunks_json
+from .utils.encryption import convert_to_segmented
+from .utils.epub_utils import build_book_index
+from .utils.faiss_index import VECTOR_ENCODINGS, index_encoding, extract_vectors, recall_at_k
+from .utils.faiss_utils import write_index
+from .utils.lexical import write_lexical_index
+
+
+def register_commands(app):
+    app.cli.add_command(convert_epubs)
+    app.cli.add_command(ingest_worker)
+    app.cli.add_command(convert_chunks)
+    app.cli.add_command(reencode_indexes)
+    app.cli.add_command(build_lexical_indexes)
+
+
+@click.command('convert-epubs')
+def convert_epubs():
+    """Rewrite legacy CBC-encrypted EPUBs in the segmented format."""
+    folder = current_app.config['FILE_UPLOAD_FOLDER']
+    key = current_app.config['FILE_ENCRYPTION_KEY']
+    converted = 0
+    for filename in sorted(os.listdir(folder)):
+        path = os.path.join(folder, filename)
+        if not os.path.isfile(path):
+            continue
+        try:
+            if convert_to_segmented(path, key):
+                converted += 1
+                click.echo(f"Converted {filename}")
+        except Exception as e:
+            click.echo(f"Skipping {filename}: {e}")
+    click.echo(f"{converted} file(s) converted")
+
+
+def _worker_process(once):
+    from . import create_app
+
+    app = create_app()
+    with app.app_context():
+        embeddings.warmup()
+        run_worker(once=once)
+
+
+@click.command('ingest-worker')
+@click.option('--workers', default=1, show_default=True, help='Number of worker processes.')
+@click.option('--once', is_flag=True, help='Exit once the queue is empty.')
+def ingest_worker(workers, once):
+    """Run background book ingestion (vectorisation and cover extraction)."""
+    if workers <= 1:
+        embeddings.warmup()
+        run_worker(once=once)
+        return
+    processes = [multiprocessing.Process(target=_worker_process, args=(once,)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+@click.command('convert-chunks')
+@click.option('--keep', is_flag=True, help='Keep the original .json.enc files.')
+def convert_chunks(keep):
+    """Convert legacy {book_id}.json.enc chunk files into chunk stores."""
+    folder = current_app.config['JSON_UPLOAD_FOLDER']
+    key = current_app.config['FILE_ENCRYPTION_KEY']
+    converted = 0
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith('.json.enc'):
+            continue
+        json_path = os.path.join(folder, filename)
+        store_path = os.path.join(folder, filename[:-len('.json.enc')] + '.chunks.enc')
+        try:
+            convert_chunks_json(json_path, store_path, key)
+            if not keep:
+                os.remove(json_path)
+            converted += 1
+            click.echo(f"Converted {filename}")
+        except Exception as e:
+            click.echo(f"Skipping {filename}: {e}")
+    click.echo(f"{converted} file(s) converted")
+
+
+@click.command('reencode-indexes')
+@click.option('--encoding', type=click.Choice(list(VECTOR_ENCODINGS)), default=None,
+              help='Target vector encoding (default: FAISS_VECTOR_ENCODING).')
+@click.option('--dry-run', is_flag=True, help='Only report the size and recall impact.')
+def reencode_indexes(encoding, dry_run):
+    """Rebuild existing per-book FAISS indexes with a different vector encoding."""
+    encoding = encoding or current_app.config['FAISS_VECTOR_ENCODING']
+    folder = current_app.config['FAISS_UPLOAD_FOLDER']
+    total_before = total_after = 0
+    recalls = []
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith('.faiss'):
+            continue
+        path = os.path.join(folder, filename)
+        index = faiss.read_index(path)
+        current = index_encoding(index)
+        if current == 'other':
+            click.echo(f"Skipping {filename}: index type chooses its own encoding")
+            continue
+        if current == encoding:
+            continue
+
+        vectors = extract_vectors(index)
+        new_index = build_book_index(vectors, encoding)
+
+        # Recall of the re-encoded index against an exact search, using stored vectors as queries
+        exact = faiss.IndexFlatL2(vectors.shape[1])
+        exact.add(vectors)
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), min(200, len(vectors)), replace=False)]
+        recall = recall_at_k(exact, new_index, sample)
+
+        before = os.path.getsize(path)
+        after = faiss.serialize_index(new_index).nbytes
+        total_before += before
+        total_after += after
+        recalls.append(recall)
+        if not dry_run:
+            write_index(new_index, path)
+        click.echo(f"{filename}: {current} -> {encoding}, {before / 2**20:.2f} MB -> {after / 2**20:.2f} MB, "
+                   f"recall@10 {recall:.3f}")
+
+    if recalls:
+        click.echo(f"{len(recalls)} index(es){' (dry run)' if dry_run else ''}: "
+                   f"{total_before / 2**20:.2f} MB -> {total_after / 2**20:.2f} MB, "
+                   f"mean recall@10 {np.mean(recalls):.3f}")
+    else:
+        click.echo("Nothing to re-encode")
+
+
+@click.command('build-lexical-indexes')
+@click.option('--force', is_flag=True, help='Rebuild indexes that already exist.')
+def build_lexical_indexes(force):
+    """Build the BM25 index of books ingested before hybrid retrieval existed."""
+    json_folder = current_app.config['JSON_UPLOAD_FOLDER']
+    faiss_folder = current_app.config['FAISS_UPLOAD_FOLDER']
+    key = current_app.config['FILE_ENCRYPTION_KEY']
+    built = 0
+    for filename in sorted(os.listdir(json_folder)):
+        if not filename.endswith('.chunks.enc'):
+            continue
+        book_id = filename[:-len('.chunks.enc')]
+        lexical_path = os.path.join(faiss_folder, f"{book_id}.bm25")
+        if os.path.exists(lexical_path) and not force:
+            continue
+        try:
+            store = ChunkStore(os.path.join(json_folder, filename), key)
+            try:
+                write_lexical_index(lexical_path, list(store), key)
+            finally:
+                store.close()
+            built += 1
+            click.echo(f"Built {book_id}.bm25")
+        except Exception as e:
+            click.echo(f"Skipping {filename}: {e}")
+    click.echo(f"{built} index(es) built")
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 import base64
@@ -26,6 +27,121 @@ class Config:
 
     ALLOWED_EXTENSIONS = {'epub', 'jpg', 'jpeg', 'png'}
 
+    # Per-process cache of decrypted EPUBs; books larger than the item limit are always streamed
+    EPUB_CACHE_MAX_BYTES = int(os.environ.get('EPUB_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    EPUB_CACHE_MAX_ITEM_BYTES = int(os.environ.get('EPUB_CACHE_MAX_ITEM_BYTES', 32 * 1024 * 1024))
+    EPUB_INDEX_CACHE_MAX_BYTES = int(os.environ.get('EPUB_INDEX_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+    # EPUB HTML parsing during ingestion: worker processes (0 = one per CPU, 1 = serial).
+    # Books with less spine XHTML than the threshold are always parsed serially.
+    EPUB_PARSE_WORKERS = int(os.environ.get('EPUB_PARSE_WORKERS', 0))
+    EPUB_PARSE_PARALLEL_MIN_BYTES = int(os.environ.get('EPUB_PARSE_PARALLEL_MIN_BYTES', 1024 * 1024))
+
+    # Chunking for the AI module: sentence/paragraph-aligned chunks of at most CHUNK_MAX_TOKENS
+    # word/punctuation tokens, each repeating up to CHUNK_OVERLAP_TOKENS from the previous one
+    CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', 160))
+    CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS', 32))
+
+    # Sentence embedding model shared by ingestion and /files/ask
+    EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 64))
+    EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', 0))  # 0 = torch default
+    EMBEDDING_DEVICE = os.environ.get('EMBEDDING_DEVICE')  # e.g. 'cpu', 'cuda'; None = auto
+    EMBEDDING_WARMUP = os.environ.get('EMBEDDING_WARMUP', 'false').lower() in ['true', '1', 'yes', 'on']
+
+    # Chunk embeddings cached on disk by (model, content hash) and reused across books;
+    # least recently used entries are evicted beyond EMBEDDING_CACHE_MAX_ENTRIES vectors
+    EMBEDDING_CACHE = os.environ.get('EMBEDDING_CACHE', 'true').lower() in ['true', '1', 'yes', 'on']
+    EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR', os.path.join(BASE_TEMP, 'embedding_cache'))
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 200000))
+
+    # Concurrent /files/ask query embeddings are coalesced into one batch
+    EMBED_QUERY_BATCHING = os.environ.get('EMBED_QUERY_BATCHING', 'true').lower() in ['true', '1', 'yes', 'on']
+    EMBED_QUERY_MAX_BATCH = int(os.environ.get('EMBED_QUERY_MAX_BATCH', 32))
+    EMBED_QUERY_MAX_WAIT_MS = float(os.environ.get('EMBED_QUERY_MAX_WAIT_MS', 5))
+
+    # LRU of query embeddings by normalized question text (entries, 0 = off); ~1.5 KiB each at 384 dims
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', 4096))
+
+    # Per-process cache of loaded FAISS indexes and decrypted chunks for /files/ask
+    BOOK_INDEX_CACHE_MAX_BYTES = int(os.environ.get('BOOK_INDEX_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    # Memory-map FAISS indexes read-only so all workers share the same page-cache pages
+    FAISS_MMAP = os.environ.get('FAISS_MMAP', 'true').lower() in ['true', '1', 'yes', 'on']
+
+    # /files/ask retrieval: the RETRIEVAL_CANDIDATES best vector and BM25 hits are fused with
+    # reciprocal rank fusion (constant RETRIEVAL_RRF_K) and the top ASK_TOP_K chunks go to the model
+    HYBRID_RETRIEVAL = os.environ.get('HYBRID_RETRIEVAL', 'true').lower() in ['true', '1', 'yes', 'on']
+    ASK_TOP_K = int(os.environ.get('ASK_TOP_K', 6))
+    RETRIEVAL_CANDIDATES = int(os.environ.get('RETRIEVAL_CANDIDATES', 30))
+    RETRIEVAL_RRF_K = int(os.environ.get('RETRIEVAL_RRF_K', 60))
+    # Of the CONTEXT_CANDIDATES retrieved chunks, MMR keeps ASK_TOP_K (CONTEXT_MMR_LAMBDA trades
+    # relevance against redundancy), overlapping neighbours are merged, and the book content
+    # sent to the model is capped at CONTEXT_TOKEN_BUDGET word/punctuation tokens
+    CONTEXT_CANDIDATES = int(os.environ.get('CONTEXT_CANDIDATES', 12))
+    CONTEXT_MMR_LAMBDA = float(os.environ.get('CONTEXT_MMR_LAMBDA', 0.7))
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1200))
+
+    # Per-book cache of /files/ask answers: a question whose embedding has cosine similarity
+    # >= ANSWER_CACHE_THRESHOLD with an earlier one (and the same numbers) reuses its answer
+    # without retrieval or a model call. Entries live ANSWER_CACHE_TTL seconds, at most
+    # ANSWER_CACHE_MAX_ENTRIES per book and ANSWER_CACHE_MAX_BOOKS books per process.
+    ANSWER_CACHE = os.environ.get('ANSWER_CACHE', 'true').lower() in ['true', '1', 'yes', 'on']
+    ANSWER_CACHE_THRESHOLD = float(os.environ.get('ANSWER_CACHE_THRESHOLD', 0.93))
+    ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', 6 * 60 * 60))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 256))
+    ANSWER_CACHE_MAX_BOOKS = int(os.environ.get('ANSWER_CACHE_MAX_BOOKS', 512))
+
+    # Chat-completions upstream (OpenRouter by default; any OpenAI-compatible server works).
+    # One pooled HTTP client per process, at most LLM_MAX_CONCURRENCY calls in flight (others
+    # queue up to LLM_QUEUE_TIMEOUT seconds), LLM_TIMEOUT/LLM_STREAM_TIMEOUT second deadlines,
+    # up to LLM_MAX_RETRIES jittered retries on 429/5xx, and a circuit breaker that fails fast
+    # for LLM_BREAKER_RESET seconds after LLM_BREAKER_THRESHOLD consecutive failures
+    LLM_BASE_URL = os.environ.get('LLM_BASE_URL', 'https://openrouter.ai/api/v1')
+    LLM_MODEL = os.environ.get('LLM_MODEL', 'meta-llama/llama-3.3-70b-instruct:free')
+    LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', 20))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('LLM_MAX_KEEPALIVE_CONNECTIONS', 10))
+    LLM_KEEPALIVE_EXPIRY = float(os.environ.get('LLM_KEEPALIVE_EXPIRY', 30))
+    LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 5))
+    LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))
+    LLM_STREAM_TIMEOUT = float(os.environ.get('LLM_STREAM_TIMEOUT', 180))
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+    LLM_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', 10))
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+    LLM_RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY', 0.5))
+    LLM_RETRY_MAX_DELAY = float(os.environ.get('LLM_RETRY_MAX_DELAY', 8))
+    LLM_BREAKER_THRESHOLD = int(os.environ.get('LLM_BREAKER_THRESHOLD', 5))
+    LLM_BREAKER_RESET = float(os.environ.get('LLM_BREAKER_RESET', 30))
+
+    # Local OpenAI-compatible backend (Ollama: http://localhost:11434/v1, llama.cpp server:
+    # http://localhost:8080/v1), registered as provider "local" when LOCAL_LLM_BASE_URL is set
+    LOCAL_LLM_BASE_URL = os.environ.get('LOCAL_LLM_BASE_URL')
+    LOCAL_LLM_MODEL = os.environ.get('LOCAL_LLM_MODEL', 'llama3.1:8b')
+    LOCAL_LLM_API_KEY = os.environ.get('LOCAL_LLM_API_KEY')
+    LOCAL_LLM_MAX_CONCURRENCY = int(os.environ.get('LOCAL_LLM_MAX_CONCURRENCY', 2))
+    LOCAL_LLM_TIMEOUT = float(os.environ.get('LOCAL_LLM_TIMEOUT', 120))
+    # Providers to try in order (e.g. "local,openrouter" fails over to OpenRouter), by default
+    # and as JSON maps of publisher_id / book_id -> route; a book's route wins over its publisher's
+    LLM_ROUTE = os.environ.get('LLM_ROUTE', 'openrouter')
+    LLM_PUBLISHER_ROUTES = json.loads(os.environ.get('LLM_PUBLISHER_ROUTES', '{}'))
+    LLM_BOOK_ROUTES = json.loads(os.environ.get('LLM_BOOK_ROUTES', '{}'))
+
+    # Per-book FAISS index type: auto, flat, hnsw, ivf, ivfpq or a raw index_factory string.
+    # auto picks by chunk count using the thresholds below.
+    FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE', 'auto')
+    FAISS_FLAT_MAX_CHUNKS = int(os.environ.get('FAISS_FLAT_MAX_CHUNKS', 10000))
+    FAISS_HNSW_MAX_CHUNKS = int(os.environ.get('FAISS_HNSW_MAX_CHUNKS', 50000))
+    FAISS_IVF_MAX_CHUNKS = int(os.environ.get('FAISS_IVF_MAX_CHUNKS', 500000))
+    FAISS_NPROBE = int(os.environ.get('FAISS_NPROBE', 16))
+    FAISS_HNSW_EF_SEARCH = int(os.environ.get('FAISS_HNSW_EF_SEARCH', 64))
+    # Vector storage: float32, fp16 (half the size) or sq8 (a quarter); `flask reencode-indexes` migrates
+    FAISS_VECTOR_ENCODING = os.environ.get('FAISS_VECTOR_ENCODING', 'float32')
+
+    # Background ingestion (flask ingest-worker)
+    INGEST_POLL_INTERVAL = float(os.environ.get('INGEST_POLL_INTERVAL', 2))
+    INGEST_STALE_AFTER = int(os.environ.get('INGEST_STALE_AFTER', 600))  # seconds without a heartbeat
+    INGEST_MAX_ATTEMPTS = int(os.environ.get('INGEST_MAX_ATTEMPTS', 3))
+    INGEST_RETRY_BASE_DELAY = float(os.environ.get('INGEST_RETRY_BASE_DELAY', 60))  # seconds, doubled per attempt
+
     # Ensure folders exist
     os.makedirs(FILE_UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(IMAGE_UPLOAD_FOLDER, exist_ok=True)
@@ -4,9 +4,13 @@ from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_cors import CORS
+from .utils.embeddings import EmbeddingService
+from .utils.llm_gateway import LLMGateway
 
 db = SQLAlchemy()
 jwt = JWTManager()
 migrate = Migrate()
 limiter = Limiter(key_func=get_remote_address)
 cors = CORS()
+embeddings = EmbeddingService()
+llm = LLMGateway()
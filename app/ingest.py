@@ -0,0 +1,175 @@
+import os
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from .extensions import db
+from .models import Book, IngestJob
+from .utils.encryption import open_decrypted
+from .utils.epub_utils import process_and_store_vectors2, extract_cover
+
+
+def enqueue_ingest(book, enable_ai, extract_cover=False):
+    job = IngestJob(book_id=book.book_id, enable_ai=enable_ai, extract_cover=extract_cover, status='queued')
+    db.session.add(job)
+    return job
+
+
+def enqueue_reindex(book):
+    """Queue a re-index after the book file changed, unless one is already waiting.
+
+    A queued job reads the file when it starts, so it will pick up the new one.
+    """
+    queued = IngestJob.query.filter_by(book_id=book.book_id, status='queued').first()
+    if queued is not None:
+        return queued
+    return enqueue_ingest(book, enable_ai=True)
+
+
+def claim_next_job():
+    """Atomically move the oldest runnable job to ``running`` and return it.
+
+    Jobs whose worker stopped sending heartbeats are picked up again until
+    they run out of attempts, and marked failed after that; failed attempts
+    wait out their backoff first.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=current_app.config['INGEST_STALE_AFTER'])
+    max_attempts = current_app.config['INGEST_MAX_ATTEMPTS']
+    # The worker died during the last attempt: nothing would ever pick the job up again
+    abandoned = IngestJob.query.filter(
+        IngestJob.status == 'running',
+        IngestJob.heartbeat_at < stale_before,
+        IngestJob.attempts >= max_attempts,
+    ).update({
+        'status': 'failed',
+        'finished_at': now,
+        'error': "Worker stopped sending heartbeats during the last attempt",
+    }, synchronize_session=False)
+    if abandoned:
+        db.session.commit()
+    runnable = db.or_(
+        db.and_(IngestJob.status == 'queued',
+                db.or_(IngestJob.not_before.is_(None), IngestJob.not_before <= now)),
+        db.and_(IngestJob.status == 'running', IngestJob.heartbeat_at < stale_before),
+    )
+    candidates = (IngestJob.query
+                  .filter(runnable, IngestJob.attempts < max_attempts)
+                  .order_by(IngestJob.job_id)
+                  .limit(5)
+                  .all())
+    for job in candidates:
+        # One job per book at a time: both would write the same index files
+        busy = IngestJob.query.filter(
+            IngestJob.book_id == job.book_id,
+            IngestJob.job_id != job.job_id,
+            IngestJob.status == 'running',
+            IngestJob.heartbeat_at >= stale_before,
+        ).first()
+        if busy:
+            continue
+        now = datetime.utcnow()
+        # Optimistic claim: only one worker can move the row away from the state it read
+        claimed = IngestJob.query.filter_by(
+            job_id=job.job_id, status=job.status, attempts=job.attempts
+        ).update({
+            'status': 'running',
+            'attempts': job.attempts + 1,
+            'started_at': now,
+            'heartbeat_at': now,
+            'chunks_done': 0,
+            'not_before': None,
+            'error': None,
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(IngestJob, job.job_id)
+    return None
+
+
+def _report_progress(job_id, done, total):
+    IngestJob.query.filter_by(job_id=job_id).update({
+        'chunks_done': done,
+        'chunks_total': total,
+        'heartbeat_at': datetime.utcnow(),
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+class BookGone(Exception):
+    """The job's book was deleted while the job waited; retrying cannot help."""
+
+
+def run_job(job):
+    key = current_app.config['FILE_ENCRYPTION_KEY']
+    job_id = job.job_id
+
+    try:
+        book = db.session.get(Book, job.book_id)
+        if book is None:
+            raise BookGone(f"Book {job.book_id} no longer exists")
+        file_path = os.path.join(current_app.config['FILE_UPLOAD_FOLDER'], book.epub_file)
+        with open_decrypted(file_path, key) as epub_file:
+            process_and_store_vectors2(epub_file, book.book_id, key,
+                                       progress=lambda done, total: _report_progress(job_id, done, total))
+            if job.extract_cover:
+                cover_image_filename = extract_cover(epub_file, book.book_id)
+                if cover_image_filename:
+                    book.cover_image = cover_image_filename
+
+        # The AI module only goes live once the index is on disk
+        book.has_ai_module = job.enable_ai
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(IngestJob, job_id)
+        if job is None:
+            return  # deleted along with its book
+        now = datetime.utcnow()
+        if not isinstance(e, BookGone) and job.attempts < current_app.config['INGEST_MAX_ATTEMPTS']:
+            # Exponential backoff, so a persistent failure does not burn every attempt at once
+            delay = current_app.config['INGEST_RETRY_BASE_DELAY'] * 2 ** (job.attempts - 1)
+            job.status = 'queued'
+            job.not_before = now + timedelta(seconds=delay)
+        else:
+            job.status = 'failed'
+        job.error = traceback.format_exc(limit=5)
+        job.finished_at = now
+        db.session.commit()
+
+
+def run_worker(once=False):
+    """Process ingest jobs until interrupted (or until the queue is empty with ``once``)."""
+    poll_interval = current_app.config['INGEST_POLL_INTERVAL']
+    while True:
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+def job_status(job):
+    status = {
+        "job_id": job.job_id,
+        "book_id": job.book_id,
+        "status": job.status,
+        "chunks_total": job.chunks_total,
+        "chunks_done": job.chunks_done,
+        "attempts": job.attempts,
+        "eta_seconds": None,
+        "error": job.error if job.status == 'failed' else None,
+        "created_at": job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        "finished_at": job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None,
+        "retry_at": job.not_before.strftime('%Y-%m-%d %H:%M:%S') if job.status == 'queued' and job.not_before else None,
+    }
+    if job.status == 'running' and job.chunks_done and job.chunks_total and job.started_at:
+        elapsed = (job.heartbeat_at - job.started_at).total_seconds()
+        status["eta_seconds"] = round(elapsed / job.chunks_done * (job.chunks_total - job.chunks_done), 1)
+    return status
@@ -43,6 +43,7 @@ class Book(db.Model):
     author = db.Column(db.String, nullable=False)
     isbn = db.Column(db.String, nullable=False)
     epub_file = db.Column(db.String)
+    file_hash = db.Column(db.String(64))  # SHA-256 of the plaintext EPUB
     cover_image = db.Column(db.String)
     language = db.Column(db.String)
     genre = db.Column(db.String)
@@ -180,3 +181,24 @@ class BooksSubscribed(db.Model):
     subscriber = db.relationship('Subscriber', backref='subscribed_books', lazy=True)
 
 
+
+class IngestJob(db.Model):
+    __tablename__ = 'ingest_jobs'
+
+    job_id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.book_id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    enable_ai = db.Column(db.Boolean, nullable=False, default=False)  # value for Book.has_ai_module once indexed
+    extract_cover = db.Column(db.Boolean, nullable=False, default=False)
+    chunks_total = db.Column(db.Integer, nullable=True)
+    chunks_done = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    not_before = db.Column(db.DateTime, nullable=True)  # retry backoff: not claimed again before this
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Relationships
+    book = db.relationship('Book', backref=db.backref('ingest_jobs', lazy=True, cascade="all, delete"))
@@ -1,18 +1,27 @@
-from flask import Blueprint, request, jsonify, current_app, send_file, Response, abort,  send_from_directory
+from flask import Blueprint, request, jsonify, current_app, send_file, Response, abort,  send_from_directory, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, decode_token
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
-from .models import Publisher, Category, Book, Reader, Highlight, Note, BooksPurchased, Cart, Wishlist, Subscriber, BooksSubscribed
-from .extensions import db, limiter
-from datetime import datetime
+from .models import Publisher, Category, Book, Reader, Highlight, Note, BooksPurchased, Cart, Wishlist, Subscriber, BooksSubscribed, IngestJob
+from .extensions import db, limiter, embeddings, llm
+from .ingest import enqueue_ingest, enqueue_reindex, job_status
+from datetime import datetime, timezone
+from werkzeug.http import http_date
+import io
+import json
+import mimetypes
 import os
-import zipfile
-from lxml import etree
-
-from .utils.ai_utils import ask_openrouter
-from .utils.encryption import decrypt_file, encrypt_file
-from .utils.epub_utils import process_and_store_vectors, process_and_store_vectors2
-from .utils.faiss_utils import load_chunks, load_index, search_index, load_chunks2
+import time
+
+from .utils.ai_utils import ask_llm, stream_llm
+from .utils.llm_gateway import LLMError
+from .utils.encryption import decrypt_file, encrypt_stream, is_segmented_file, open_segmented, open_decrypted, iter_decrypted_range
+from .utils.epub_utils import process_and_store_vectors, build_member_index, read_member, extract_cover
+from .utils.cache import get_cache, cache_stats
+from .utils.answer_cache import get_answer_cache
+from .utils.metrics import get_histogram, histogram_stats
+from .utils.faiss_utils import load_chunks, search_ids, get_records, stored_vectors, embed_query, index_stamp, load_book
+from .utils.context import build_context
 
 ph = PasswordHasher()
 auth = Blueprint('auth', __name__)
@@ -175,47 +184,6 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 
-def extract_cover(epub_path, book_id):
-    try:
-        with zipfile.ZipFile(epub_path, 'r') as epub:
-            # Step 1: Find content.opf using container.xml
-            container_path = 'META-INF/container.xml'
-            with epub.open(container_path) as container_file:
-                container_xml = etree.parse(container_file)
-                opf_path = container_xml.xpath("//*[local-name()='rootfile']/@full-path")[0]
-
-            # Step 2: Parse content.opf to get the cover image
-            with epub.open(opf_path) as opf_file:
-                opf_xml = etree.parse(opf_file)
-
-                # Search for cover image using 'cover' ID or properties="cover-image"
-                cover_item = opf_xml.xpath("//*[local-name()='item'][@id='cover' or @properties='cover-image']")
-
-                if not cover_item:
-                    raise Exception('Cover image not found.')
-
-                cover_href = cover_item[0].get('href')
-
-                # Ensure correct relative path
-                cover_path = os.path.join(os.path.dirname(opf_path), cover_href).replace("\\", "/")
-
-                # Step 3: Extract cover image
-                with epub.open(cover_path) as cover_file:
-                    cover_ext = os.path.splitext(cover_href)[1]
-                    cover_image_filename = f"{book_id}{cover_ext}"
-                    full_cover_image_path = os.path.join(current_app.config['IMAGE_UPLOAD_FOLDER'],
-                                                         cover_image_filename)
-
-                    with open(full_cover_image_path, 'wb') as out_file:
-                        out_file.write(cover_file.read())
-
-                    return cover_image_filename
-    except Exception as e:
-        print(f"Cover extraction failed: {e}")
-        return None
-
-
-
 # Helper function to check allowed image file extensions
 def allowed_image(filename):
     allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
@@ -461,6 +429,7 @@ def update_book(book_id):
         file_upload_folder = current_app.config['FILE_UPLOAD_FOLDER']
         image_upload_folder = current_app.config['IMAGE_UPLOAD_FOLDER']
 
+        reindex_job = None
         if 'file' in request.files:
             file = request.files['file']
             if file.filename:
@@ -468,10 +437,19 @@ def update_book(book_id):
                     file_ext = os.path.splitext(file.filename)[1]  # Get file extension
                     epub_filename = f"{book.book_id}{file_ext}"
                     full_file_path = os.path.join(file_upload_folder, epub_filename)
-                    file.save(full_file_path)
+                    previous_hash = book.file_hash
+                    book.file_hash = encrypt_stream(file.stream, full_file_path,
+                                                    current_app.config['FILE_ENCRYPTION_KEY'])
 
                     book.epub_file = epub_filename  # Store updated file name
 
+                    # Refresh the AI index for the new edition; only changed chunks get re-embedded
+                    ai_pending = IngestJob.query.filter(IngestJob.book_id == book.book_id,
+                                                        IngestJob.enable_ai.is_(True),
+                                                        IngestJob.status.in_(['queued', 'running'])).first()
+                    if book.file_hash != previous_hash and (book.has_ai_module or ai_pending):
+                        reindex_job = enqueue_reindex(book)
+
                 else:
                     return jsonify({"error": "Invalid file type"}), 400
 
@@ -508,9 +486,10 @@ def update_book(book_id):
 
         db.session.commit()
 
-        return jsonify({
-            "message": "Book updated successfully"
-        }), 200
+        response = {"message": "Book updated successfully"}
+        if reindex_job is not None:
+            response["job_id"] = reindex_job.job_id
+        return jsonify(response), 200
 
     except Exception as e:
         db.session.rollback()
@@ -1372,6 +1351,111 @@ def delete_wishlist(wishlist_id):
         return jsonify({"error": str(e)}), 500
 
 
+def stream_epub(file_path):
+    key = current_app.config['FILE_ENCRYPTION_KEY']
+    stat = os.stat(file_path)
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    # HTTP dates have one-second resolution; If-Range compares against this exact value
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    headers = {'Accept-Ranges': 'bytes', 'ETag': f'"{etag}"', 'Last-Modified': http_date(last_modified)}
+
+    byte_range = request.range
+    if byte_range is not None and (byte_range.units != 'bytes' or len(byte_range.ranges) != 1):
+        # Multipart ranges are not supported; fall back to the full body
+        byte_range = None
+    if byte_range is not None and 'If-Range' in request.headers:
+        # If-Range: only honour the range if the representation is unchanged
+        if_range = request.if_range
+        if if_range.etag is not None:
+            # Strong comparison: werkzeug drops the W/ prefix, so a weak tag never matches
+            if if_range.etag != etag or request.headers['If-Range'].lstrip().startswith('W/'):
+                byte_range = None
+        elif if_range.date != last_modified:
+            byte_range = None
+
+    cache = get_cache('epub', current_app.config['EPUB_CACHE_MAX_BYTES'])
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    decrypted_data = cache.get(file_path, stamp)
+
+    max_item_bytes = current_app.config['EPUB_CACHE_MAX_ITEM_BYTES']
+    if decrypted_data is None and is_segmented_file(file_path):
+        with open_segmented(file_path, key) as reader:
+            size = reader.size
+            # Only a full-body GET warms the cache; a range that misses it
+            # decrypts just the segments it covers
+            if byte_range is None and size <= max_item_bytes:
+                decrypted_data = reader.read_range(0, size)
+                cache.put(file_path, decrypted_data, stamp)
+    elif decrypted_data is None:
+        # Legacy single-blob files have to be decrypted in one go
+        with open(file_path, "rb") as f:
+            decrypted_data = decrypt_file(f.read(), key)
+        if len(decrypted_data) <= max_item_bytes:
+            cache.put(file_path, decrypted_data, stamp)
+
+    if decrypted_data is not None:
+        size = len(decrypted_data)
+        read_range = lambda start, end: [decrypted_data[start:end]]
+    else:
+        # Not cached: decrypt one segment at a time, touching only the
+        # segments covering the requested range
+        read_range = lambda start, end: iter_decrypted_range(file_path, key, start, end)
+
+    if byte_range is None:
+        headers['Content-Length'] = str(size)
+        return Response(read_range(0, size), content_type='application/epub+zip', headers=headers)
+
+    bounds = byte_range.range_for_length(size)
+    if bounds is None:
+        headers['Content-Range'] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    start, end = bounds
+    headers['Content-Length'] = str(end - start)
+    headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+    return Response(read_range(start, end), status=206, content_type='application/epub+zip', headers=headers)
+
+
+def _member_index_size(index):
+    # Rough footprint: name plus a small tuple of ints per member
+    return sum(len(name) + 100 for name in index)
+
+
+def stream_epub_member(file_path, member):
+    key = current_app.config['FILE_ENCRYPTION_KEY']
+    stat = os.stat(file_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    decrypted_data = get_cache('epub', current_app.config['EPUB_CACHE_MAX_BYTES']).get(file_path, stamp)
+    if decrypted_data is not None:
+        fileobj = io.BytesIO(decrypted_data)
+    else:
+        fileobj = open_decrypted(file_path, key)
+
+    with fileobj:
+        index_cache = get_cache('epub_members', current_app.config['EPUB_INDEX_CACHE_MAX_BYTES'],
+                                sizeof=_member_index_size)
+        index = index_cache.get(file_path, stamp)
+        if index is None:
+            index = build_member_index(fileobj)
+            index_cache.put(file_path, index, stamp)
+
+        entry = index.get(member)
+        if entry is None:
+            return jsonify({"error": "Member not found"}), 404
+        data = read_member(fileobj, entry)
+
+    content_type = mimetypes.guess_type(member)[0] or 'application/octet-stream'
+    return Response(data, content_type=content_type,
+                    headers={'ETag': f'"{stat.st_mtime_ns:x}-{stat.st_size:x}-{entry[0]:x}"'})
+
+
+@book_bp.route('/cache_stats', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    return jsonify(cache_stats()), 200
+
+
 @book_bp.route('/stream/<filename>')
 @jwt_required()
 def serve_epub(filename):
@@ -1386,12 +1470,7 @@ def serve_epub(filename):
         return {"error": "File not found"}, 404
 
     try:
-        with open(file_path, "rb") as f:
-            encrypted_data = f.read()
-
-        decrypted_data = decrypt_file(encrypted_data, current_app.config['FILE_ENCRYPTION_KEY'])
-
-        return Response(decrypted_data, content_type='application/epub+zip')
+        return stream_epub(file_path)
 
     except Exception as e:
         return {"error": f"Decryption failed: {str(e)}"}, 500
@@ -1411,12 +1490,47 @@ def serve_epub2(filename):
         return {"error": "File not found"}, 404
 
     try:
-        with open(file_path, "rb") as f:
-            encrypted_data = f.read()
+        return stream_epub(file_path)
+
+    except Exception as e:
+        return {"error": f"Decryption failed: {str(e)}"}, 500
+
 
-        decrypted_data = decrypt_file(encrypted_data, current_app.config['FILE_ENCRYPTION_KEY'])
+@book_bp.route('/stream/<filename>/<path:member>')
+@jwt_required()
+def serve_epub_member(filename, member):
+
+    reader_id = get_jwt_identity()
+    reader = Reader.query.get(reader_id)
+    if not reader:
+        return jsonify({"error": "Reader not found"}), 404
+    file_path = os.path.join(current_app.config['FILE_UPLOAD_FOLDER'], filename)
+
+    if not os.path.isfile(file_path):
+        return {"error": "File not found"}, 404
+
+    try:
+        return stream_epub_member(file_path, member)
+
+    except Exception as e:
+        return {"error": f"Decryption failed: {str(e)}"}, 500
 
-        return Response(decrypted_data, content_type='application/epub+zip')
+
+@book_bp.route('/pub/stream/<filename>/<path:member>')
+@jwt_required()
+def serve_epub_member2(filename, member):
+
+    publisher_id = get_jwt_identity()
+    publisher = Publisher.query.get(publisher_id)
+    if not publisher:
+        return jsonify({"error": "Publisher not found"}), 404
+    file_path = os.path.join(current_app.config['FILE_UPLOAD_FOLDER'], filename)
+
+    if not os.path.isfile(file_path):
+        return {"error": "File not found"}, 404
+
+    try:
+        return stream_epub_member(file_path, member)
 
     except Exception as e:
         return {"error": f"Decryption failed: {str(e)}"}, 500
@@ -1688,6 +1802,105 @@ def serve_cover_image(filename):
     return send_from_directory(image_folder, filename)
 
 
+def _ask_paths(book_id):
+    """``(chunks_path, faiss_path, lexical_path)`` of a book, or None if it has no AI index."""
+    store_path = os.path.join(current_app.config['JSON_UPLOAD_FOLDER'], f"{book_id}.chunks.enc")
+    json_path = os.path.join(current_app.config['JSON_UPLOAD_FOLDER'], f"{book_id}.json.enc")
+    faiss_path = os.path.join(current_app.config['FAISS_UPLOAD_FOLDER'], f"{book_id}.faiss")
+
+    # Books ingested before the chunk store existed still have a single JSON document
+    chunks_path = store_path if os.path.exists(store_path) else json_path
+    if not os.path.exists(chunks_path) or not os.path.exists(faiss_path):
+        return None
+    return chunks_path, faiss_path, os.path.join(current_app.config['FAISS_UPLOAD_FOLDER'], f"{book_id}.bm25")
+
+
+def _prepare_ask(book_id, question, paths, query_embedding):
+    """Retrieve and trim the context for ``question``.
+
+    Returns ``(metadata, records, context_tokens, full_context)``.
+    """
+    chunks_path, faiss_path, lexical_path = paths
+    index, chunks, metadata, lexical = load_book(str(book_id), chunks_path, faiss_path,
+                                                 current_app.config['FILE_ENCRYPTION_KEY'],
+                                                 current_app.config['BOOK_INDEX_CACHE_MAX_BYTES'],
+                                                 mmap=current_app.config['FAISS_MMAP'],
+                                                 lexical_path=lexical_path)
+    if not current_app.config['HYBRID_RETRIEVAL']:
+        lexical = None
+
+    # Retrieve a wider candidate set, then let MMR pick ASK_TOP_K non-redundant chunks
+    ids = search_ids(question, chunks, index, top_k=current_app.config['CONTEXT_CANDIDATES'], lexical=lexical,
+                     candidates=current_app.config['RETRIEVAL_CANDIDATES'],
+                     rrf_k=current_app.config['RETRIEVAL_RRF_K'], query_embedding=query_embedding)
+    records, context_tokens = build_context(get_records(chunks, ids), stored_vectors(index, ids), query_embedding,
+                                            top_k=current_app.config['ASK_TOP_K'],
+                                            budget=current_app.config['CONTEXT_TOKEN_BUDGET'],
+                                            lambda_=current_app.config['CONTEXT_MMR_LAMBDA'])
+
+    # Combine metadata + context for AI
+    metadata_str = "\n".join([f"{k}: {v}" for k, v in metadata.items()])
+    context_str = "\n\n".join(record['text'] for record in records)
+    full_context = f"{metadata_str}\n\n{context_str}"
+    return metadata, records, context_tokens, full_context
+
+
+def _context_payload(book_id, question, metadata, records, context_tokens):
+    return {
+        "book_id": book_id,
+        "question": question,
+        "metadata": metadata,
+        "context_used": [record['text'] for record in records],
+        # Where each chunk sits in the book, so the reader can jump to it (absent for old ingests)
+        "sources": [{k: record[k] for k in ('chapter', 'href', 'start', 'end')} if 'href' in record else None
+                    for record in records],
+        "context_tokens": context_tokens,
+    }
+
+
+def _answer_cache():
+    if not current_app.config['ANSWER_CACHE']:
+        return None
+    return get_answer_cache(threshold=current_app.config['ANSWER_CACHE_THRESHOLD'],
+                            ttl=current_app.config['ANSWER_CACHE_TTL'],
+                            max_entries=current_app.config['ANSWER_CACHE_MAX_ENTRIES'],
+                            max_books=current_app.config['ANSWER_CACHE_MAX_BOOKS'])
+
+
+def _lookup_answer(book_id, question, paths):
+    """Embed ``question`` and look for a cached answer to a near-identical one.
+
+    Returns ``(query_embedding, stamp, hit)``; ``hit`` is the cached payload,
+    marked with the similarity it matched at, or None. The cache is shared by
+    every reader of the book, so a hit never carries the question it answered.
+    """
+    query_embedding = embed_query(question)
+    answers = _answer_cache()
+    if answers is None:
+        return query_embedding, None, None
+    # Rebuilding the book's vectors replaces the index file, which drops its cached answers
+    stamp = index_stamp(paths[1])
+    cached = answers.lookup(str(book_id), stamp, query_embedding, question)
+    if cached is None:
+        return query_embedding, stamp, None
+    payload, similarity = cached
+    return query_embedding, stamp, dict(payload, question=question,
+                                        cached={"hit": True, "similarity": similarity})
+
+
+def _llm_route(book_id):
+    book = Book.query.get(book_id)
+    return llm.route_for(book.book_id, book.publisher_id) if book else None
+
+
+def _store_answer(book_id, stamp, query_embedding, payload):
+    answers = _answer_cache()
+    if answers is not None and stamp is not None:
+        # Other readers may be served this answer: keep their question, not this one
+        shared = {k: v for k, v in payload.items() if k not in ('question', 'cached')}
+        answers.store(str(book_id), stamp, query_embedding, payload["question"], shared)
+
+
 @files_bp.route('/ask', methods=['POST'])
 @jwt_required()
 def ask():
@@ -1704,33 +1917,115 @@ def ask():
         if not book_id or not question:
             return jsonify({'error': 'Missing book_id or question'}), 400
 
-        json_path = os.path.join(current_app.config['JSON_UPLOAD_FOLDER'], f"{book_id}.json.enc")
-        faiss_path = os.path.join(current_app.config['FAISS_UPLOAD_FOLDER'], f"{book_id}.faiss")
-
-        if not os.path.exists(json_path) or not os.path.exists(faiss_path):
+        paths = _ask_paths(book_id)
+        if paths is None:
             return jsonify({'error': 'Book index or chunks not found'}), 404
 
-        chunks, metadata = load_chunks2(json_path, current_app.config['FILE_ENCRYPTION_KEY'])
-        index = load_index(faiss_path)
-        relevant_chunks = search_index(question, chunks, index)
+        query_embedding, stamp, hit = _lookup_answer(book_id, question, paths)
+        if hit is not None:
+            return jsonify(hit)
 
-        # Combine metadata + context for AI
-        metadata_str = "\n".join([f"{k}: {v}" for k, v in metadata.items()])
-        context_str = "\n\n".join(relevant_chunks)
-        full_context = f"{metadata_str}\n\n{context_str}"
-        response = ask_openrouter(question, full_context)
+        metadata, records, context_tokens, full_context = _prepare_ask(book_id, question, paths, query_embedding)
 
-        return jsonify({
-            "book_id": book_id,
-            "question": question,
-            "metadata": metadata,
-            "context_used": relevant_chunks,
-            "response": response
-        })
+        try:
+            response, provider = ask_llm(question, full_context, route=_llm_route(book_id))
+        except LLMError as e:
+            return jsonify({'error': str(e)}), e.status
+
+        payload = _context_payload(book_id, question, metadata, records, context_tokens)
+        payload["response"] = response
+        payload["provider"] = provider
+        payload["cached"] = None
+        _store_answer(book_id, stamp, query_embedding, payload)
+        return jsonify(payload)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@files_bp.route('/ask/stream', methods=['POST'])
+@jwt_required()
+def ask_stream():
+    """Like /ask, but as Server-Sent Events: ``context`` first, then ``token``
+    events as the model writes, then ``done`` (or ``error``)."""
+    started = time.perf_counter()
+    try:
+        reader_id = get_jwt_identity()
+        reader = Reader.query.get(reader_id)
+        if not reader:
+            return jsonify({"error": "Reader not found"}), 404
+
+        data = request.get_json()
+        book_id = data.get('book_id')
+        question = data.get('question')
+
+        if not book_id or not question:
+            return jsonify({'error': 'Missing book_id or question'}), 400
+
+        paths = _ask_paths(book_id)
+        if paths is None:
+            return jsonify({'error': 'Book index or chunks not found'}), 404
 
+        query_embedding, stamp, hit = _lookup_answer(book_id, question, paths)
+        if hit is None:
+            route = _llm_route(book_id)
+            metadata, records, context_tokens, full_context = _prepare_ask(book_id, question, paths,
+                                                                           query_embedding)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    def cached_events():
+        context = {k: v for k, v in hit.items() if k not in ('response', 'cached')}
+        yield _sse('context', context)
+        yield _sse('token', {"text": hit['response']})
+        yield _sse('done', {"response": hit['response'], "provider": hit.get('provider'), "cached": hit['cached']})
+
+    def events():
+        payload = _context_payload(book_id, question, metadata, records, context_tokens)
+        yield _sse('context', payload)
+        answer = []
+        deltas = stream_llm(question, full_context, route=route)
+        try:
+            for delta in deltas:
+                if not answer:
+                    # Measured from the request, so it includes retrieval as the reader experiences it
+                    get_histogram('ask_time_to_first_token_ms').observe((time.perf_counter() - started) * 1000)
+                answer.append(delta)
+                yield _sse('token', {"text": delta})
+            get_histogram('ask_stream_duration_ms').observe((time.perf_counter() - started) * 1000)
+            payload["response"] = ''.join(answer).strip()
+            payload["provider"] = deltas.provider
+            payload["cached"] = None
+            _store_answer(book_id, stamp, query_embedding, payload)
+            yield _sse('done', {"response": payload["response"], "provider": deltas.provider, "cached": None})
+        except LLMError as e:
+            yield _sse('error', {"error": str(e), "status": e.status})
+        except Exception as e:
+            yield _sse('error', {"error": f"LLM Error: {e}", "status": 500})
+        finally:
+            # Runs on client disconnect too (the server closes this generator): stop the upstream call
+            deltas.close()
+
+    return Response(stream_with_context(cached_events() if hit is not None else events()),
+                    mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@files_bp.route('/ask/metrics', methods=['GET'])
+@jwt_required()
+def get_ask_metrics():
+    return jsonify({
+        "query_embedding_batches": embeddings.batcher.stats() if embeddings.batcher else None,
+        "query_embedding_cache": embeddings.query_cache.stats() if embeddings.query_cache else None,
+        "caches": cache_stats(),
+        "answer_cache": _answer_cache().stats() if _answer_cache() else None,
+        "llm": llm.stats(),
+        "histograms": histogram_stats()
+    }), 200
+
 
 @files_bp.route('/pub/upload_book', methods=['POST'])
 @jwt_required()
@@ -1775,14 +2070,8 @@ def upload_book():
         epub_filename = f"{new_book_id}{file_ext}"
         full_file_path = os.path.join(current_app.config['FILE_UPLOAD_FOLDER'], epub_filename)
 
-        # Save the uploaded file temporarily (unencrypted)
-        temp_path = os.path.join(current_app.config['TEMP_UPLOAD_FOLDER'], f"{new_book_id}_temp{file_ext}")
-        file_bytes = file.read()
-        with open(temp_path, 'wb') as temp_f:
-            temp_f.write(file_bytes)
-
-        # Process vectors before encryption
-        process_and_store_vectors2(temp_path, new_book_id, current_app.config["FILE_ENCRYPTION_KEY"])
+        # Hash and encrypt the upload straight into storage, one segment at a time
+        file_hash = encrypt_stream(file.stream, full_file_path, current_app.config['FILE_ENCRYPTION_KEY'])
 
         cover_image_filename = None
 
@@ -1796,17 +2085,6 @@ def upload_book():
                 cover_image.save(full_cover_image_path)
             elif cover_image.filename != '':
                 return jsonify({"error": "Invalid cover image type"}), 400
-        else:
-            # Extract cover image from unencrypted EPUB (before encryption)
-            cover_image_filename = extract_cover(temp_path, new_book_id)
-
-        # Encrypt the original EPUB file content
-        encrypted_data = encrypt_file(file_bytes, current_app.config['FILE_ENCRYPTION_KEY'])
-        with open(full_file_path, 'wb') as f:
-            f.write(encrypted_data)
-
-        # Delete temporary unencrypted file
-        os.remove(temp_path)
 
         # Check if book title already exists
         existing_book = Book.query.filter_by(title=title).first()
@@ -1819,6 +2097,7 @@ def upload_book():
             author=author,
             isbn=isbn,
             epub_file=epub_filename,
+            file_hash=file_hash,
             cover_image=cover_image_filename,
             language=language,
             genre=genre,
@@ -1828,19 +2107,46 @@ def upload_book():
             description=description,
             status=book_status,
             offer_price=offer_price,
-            has_ai_module = has_ai_module
+            has_ai_module=False  # Turned on by the ingest worker once the index is ready
         )
         db.session.add(new_book)
         db.session.flush()
+
+        # Vectorisation (and cover extraction if none was uploaded) runs in `flask ingest-worker`
+        job = enqueue_ingest(new_book, enable_ai=has_ai_module, extract_cover=cover_image_filename is None)
         db.session.commit()
 
-        return jsonify({"message": "Book uploaded successfully"}), 201
+        return jsonify({
+            "message": "Book uploaded successfully, processing started",
+            "book_id": new_book.book_id,
+            "job_id": job.job_id
+        }), 202
 
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
+@files_bp.route('/pub/upload_status/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_upload_status(job_id):
+    try:
+        publisher_id = get_jwt_identity()
+
+        job = IngestJob.query.join(Book).filter(
+            IngestJob.job_id == job_id,
+            Book.publisher_id == publisher_id
+        ).first()
+
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+
+        return jsonify(job_status(job)), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @files_bp.route('/pub/upload_book_simple', methods=['POST'])
 @jwt_required()
 def upload_book_simple():
@@ -1884,11 +2190,8 @@ def upload_book_simple():
         epub_filename = f"{new_book_id}{file_ext}"
         full_file_path = os.path.join(current_app.config['FILE_UPLOAD_FOLDER'], epub_filename)
 
-        # Save the file temporarily before encryption
-        temp_path = os.path.join(current_app.config['TEMP_UPLOAD_FOLDER'], f"{new_book_id}_temp{file_ext}")
-        file_bytes = file.read()
-        with open(temp_path, 'wb') as temp_f:
-            temp_f.write(file_bytes)
+        # Hash and encrypt the upload straight into storage, one segment at a time
+        file_hash = encrypt_stream(file.stream, full_file_path, current_app.config['FILE_ENCRYPTION_KEY'])
 
         cover_image_filename = None
 
@@ -1903,16 +2206,9 @@ def upload_book_simple():
             elif cover_image.filename != '':
                 return jsonify({"error": "Invalid cover image type"}), 400
         else:
-            # Extract cover image from unencrypted file
-            cover_image_filename = extract_cover(temp_path, new_book_id)
-
-        # Encrypt and save file
-        encrypted_data = encrypt_file(file_bytes, current_app.config['FILE_ENCRYPTION_KEY'])
-        with open(full_file_path, 'wb') as f:
-            f.write(encrypted_data)
-
-        # Delete temp file
-        os.remove(temp_path)
+            # Extract cover image from the encrypted copy
+            with open_decrypted(full_file_path, current_app.config['FILE_ENCRYPTION_KEY']) as epub_file:
+                cover_image_filename = extract_cover(epub_file, new_book_id)
 
         # Check if book title already exists
         existing_book = Book.query.filter_by(title=title).first()
@@ -1925,6 +2221,7 @@ def upload_book_simple():
             author=author,
             isbn=isbn,
             epub_file=epub_filename,
+            file_hash=file_hash,
             cover_image=cover_image_filename,
             language=language,
             genre=genre,
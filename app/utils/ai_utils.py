@@ -1,15 +1,8 @@
-from openai import OpenAI
-import os
+from ..extensions import llm
 
 
-# Initialize OpenRouter client
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key= os.environ.get('AI_API_KEY'),
-)
-
-def ask_openrouter(question, context):
-    full_prompt = f"""You are a helpful assistant. Use the context below to answer the user's question.
+def build_prompt(question, context):
+    return f"""You are a helpful assistant. Use the context below to answer the user's question.
 
 Book content:
 {context}
@@ -18,19 +11,19 @@ Question: {question}
 
 Answer:"""
 
-    try:
-        # Make the API call
-        completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": "<YOUR_SITE_URL>",  # Optional
-                "X-Title": "<YOUR_SITE_NAME>",      # Optional
-            },
-            extra_body={},
-            model="meta-llama/llama-3.3-70b-instruct:free",
-            messages=[
-                {"role": "user", "content": full_prompt}
-            ]
-        )
-        return completion.choices[0].message.content.strip()
-    except Exception as e:
-        return f"⚠️ OpenRouter Error: {e}"
\ No newline at end of file
+
+def ask_llm(question, context, route=None):
+    """Answer ``question`` from ``context`` with the first provider in ``route`` that responds.
+
+    Returns ``(answer, provider name)``; raises ``LLMError`` when none can be reached.
+    """
+    return llm.complete([{"role": "user", "content": build_prompt(question, context)}], route=route)
+
+
+def stream_llm(question, context, route=None):
+    """Return an ``LLMStream`` of the answer's text deltas as the model produces them.
+
+    Closing it (e.g. because the reader went away) closes the upstream HTTP
+    response, which cancels the completion.
+    """
+    return llm.stream([{"role": "user", "content": build_prompt(question, context)}], route=route)
@@ -0,0 +1,157 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+_NUMBER = re.compile(r'\d+')
+
+
+def _numbers(question):
+    # "chapter 1" and "chapter 2" embed almost identically; numbers must match exactly
+    return tuple(_NUMBER.findall(question))
+
+
+class _BookAnswers:
+    def __init__(self, stamp, dim):
+        self.stamp = stamp
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self.entries = OrderedDict()  # id -> (numbers, payload, stored_at), oldest first
+        self.next_id = 0
+
+    def remove(self, ids):
+        for entry_id in ids:
+            del self.entries[entry_id]
+        self.index.remove_ids(np.array(ids, dtype='int64'))
+
+
+class SemanticAnswerCache:
+    """Per-book cache of answers, matched by query-embedding similarity.
+
+    A question hits when a cached one of the same book has cosine similarity
+    of at least ``threshold`` and the same numbers in it. Every book keeps its
+    vectors in a small flat inner-product FAISS index; entries expire after
+    ``ttl`` seconds, a book holds at most ``max_entries`` (oldest go first) and
+    at most ``max_books`` books are kept (least recently used go first). Like
+    ``LRUCache``, each book carries a ``stamp`` of its vector index; a lookup
+    with a different stamp drops everything cached for the book.
+    """
+
+    def __init__(self, threshold=0.93, ttl=6 * 3600, max_entries=256, max_books=512):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_books = max_books
+        self._books = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype='float32').reshape(1, -1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _book(self, book_id, stamp):
+        book = self._books.get(book_id)
+        if book is not None and book.stamp != stamp:
+            del self._books[book_id]
+            self.invalidations += 1
+            return None
+        if book is not None:
+            self._books.move_to_end(book_id)
+        return book
+
+    def _expire(self, book):
+        cutoff = time.time() - self.ttl
+        expired = []
+        for entry_id, (_, _, stored_at) in book.entries.items():
+            if stored_at >= cutoff:
+                break
+            expired.append(entry_id)
+        if expired:
+            book.remove(expired)
+            self.expirations += len(expired)
+
+    def lookup(self, book_id, stamp, vector, question):
+        """Return ``(payload, similarity)`` of the best matching cached answer, or None."""
+        query = self._unit(vector)
+        numbers = _numbers(question)
+        with self._lock:
+            book = self._book(book_id, stamp)
+            if book is not None:
+                self._expire(book)
+            if book is None or not book.entries:
+                self.misses += 1
+                return None
+            # A few neighbours, in case the nearest has different numbers
+            similarities, ids = book.index.search(query, min(4, len(book.entries)))
+            for similarity, entry_id in zip(similarities[0].tolist(), ids[0].tolist()):
+                if similarity < self.threshold:
+                    break
+                entry = book.entries.get(entry_id)
+                if entry is not None and entry[0] == numbers:
+                    self.hits += 1
+                    return entry[1], similarity
+            self.misses += 1
+            return None
+
+    def store(self, book_id, stamp, vector, question, payload):
+        with self._lock:
+            book = self._book(book_id, stamp)
+            if book is None:
+                book = self._books[book_id] = _BookAnswers(stamp, np.asarray(vector).size)
+                while len(self._books) > self.max_books:
+                    _, evicted = self._books.popitem(last=False)
+                    self.evictions += len(evicted.entries)
+            self._expire(book)
+            if len(book.entries) >= self.max_entries:
+                oldest = list(book.entries)[:len(book.entries) - self.max_entries + 1]
+                book.remove(oldest)
+                self.evictions += len(oldest)
+            entry_id = book.next_id
+            book.next_id += 1
+            book.index.add_with_ids(self._unit(vector), np.array([entry_id], dtype='int64'))
+            book.entries[entry_id] = (_numbers(question), payload, time.time())
+            self.stores += 1
+
+    def invalidate(self, book_id):
+        with self._lock:
+            if self._books.pop(book_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "books": len(self._books),
+                "entries": sum(len(book.entries) for book in self._books.values()),
+                "threshold": self.threshold,
+            }
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache(threshold, ttl, max_entries, max_books):
+    """Return the process-wide answer cache, creating it on first use."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(threshold, ttl, max_entries, max_books)
+        return _answer_cache
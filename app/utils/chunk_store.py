@@ -0,0 +1,141 @@
+import json
+import mmap
+import os
+import struct
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .encryption import decrypt_file
+
+# Chunk store format (version 2):
+#   header  = MAGIC (4) | version (1) | reserved (3) | record count (4, big-endian) | reserved (4)
+#   offsets = (count + 1) big-endian uint64 offsets into the record area
+#   records = nonce (12) | AES-GCM ciphertext + tag, one per record
+# Record 0 is the book metadata as JSON, records 1..n are the chunks as JSON
+# objects: {"text", "chapter", "href", "start", "end"}, where only "text" is
+# required. Version 1 stores were identical except that chunk records held
+# the bare text. Every record is bound to its position through the associated data.
+STORE_MAGIC = b'HPRC'
+STORE_VERSION = 2
+_READABLE_VERSIONS = (1, 2)
+_HEADER = struct.Struct('>4sB3xI4x')
+_OFFSET = struct.Struct('>Q')
+_NONCE_SIZE = 12
+
+
+def _record_aad(header, index):
+    return header + struct.pack('>I', index)
+
+
+def is_chunk_store(path):
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+    return len(header) == _HEADER.size and header[:4] == STORE_MAGIC and header[4] in _READABLE_VERSIONS
+
+
+def write_chunk_store(path, metadata, chunks, key: bytes):
+    """Write ``metadata`` and ``chunks`` as individually encrypted records, atomically.
+
+    ``chunks`` are dicts with at least a ``text`` key, or plain strings.
+    """
+    aead = AESGCM(key)
+    header = _HEADER.pack(STORE_MAGIC, STORE_VERSION, len(chunks) + 1)
+    texts = [json.dumps(metadata, ensure_ascii=False)]
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = {"text": chunk}
+        texts.append(json.dumps(chunk, ensure_ascii=False))
+
+    records = []
+    offsets = [0]
+    for index, text in enumerate(texts):
+        nonce = os.urandom(_NONCE_SIZE)
+        record = nonce + aead.encrypt(nonce, text.encode('utf-8'), _record_aad(header, index))
+        records.append(record)
+        offsets.append(offsets[-1] + len(record))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(b''.join(_OFFSET.pack(offset) for offset in offsets))
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+
+
+class ChunkStore:
+    """Read-only view of a chunk store; records are decrypted on access.
+
+    Behaves like a list of chunk strings (``len``, indexing), so it can be
+    passed to ``search_index`` in place of a fully decrypted list. ``record``
+    returns the full chunk with its position in the book.
+    """
+
+    def __init__(self, path, key: bytes):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._header = self._map[:_HEADER.size]
+        magic, version, count = _HEADER.unpack(self._header)
+        if magic != STORE_MAGIC or version not in _READABLE_VERSIONS:
+            raise ValueError("Not a chunk store")
+        self._version = version
+        self._count = count
+        table_end = _HEADER.size + (count + 1) * _OFFSET.size
+        self._offsets = [offset for (offset,) in _OFFSET.iter_unpack(self._map[_HEADER.size:table_end])]
+        self._data_start = table_end
+        self._aead = AESGCM(key)
+        self._metadata = None
+
+    def _record(self, index):
+        start = self._data_start + self._offsets[index]
+        end = self._data_start + self._offsets[index + 1]
+        record = self._map[start:end]
+        plaintext = self._aead.decrypt(record[:_NONCE_SIZE], record[_NONCE_SIZE:], _record_aad(self._header, index))
+        return plaintext.decode('utf-8')
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = json.loads(self._record(0))
+        return self._metadata
+
+    def __len__(self):
+        return self._count - 1
+
+    def record(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        if self._version == 1:
+            return {"text": self._record(i + 1)}
+        return json.loads(self._record(i + 1))
+
+    def __getitem__(self, i):
+        return self.record(i)['text']
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get_many(self, ids):
+        return [self[i] for i in ids]
+
+    @property
+    def nbytes(self):
+        return len(self._offsets) * 8
+
+    def close(self):
+        self._map.close()
+
+
+def convert_chunks_json(json_path, store_path, key: bytes):
+    """Convert a legacy ``{book_id}.json.enc`` file into a chunk store."""
+    with open(json_path, 'rb') as f:
+        data = json.loads(decrypt_file(f.read(), key).decode('utf-8'))
+    # process_and_store_vectors wrote a bare list, process_and_store_vectors2 a dict
+    if isinstance(data, list):
+        metadata, chunks = {}, data
+    else:
+        metadata, chunks = data.get('metadata', {}), data['chunks']
+    write_chunk_store(store_path, metadata, chunks, key)
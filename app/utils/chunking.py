@@ -0,0 +1,155 @@
+import hashlib
+import re
+
+# Words and single punctuation marks; close to the word-piece count of the embedding tokenizer
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+# Sentence end: terminal punctuation, optional closing quotes/brackets, whitespace,
+# then something that does not look like a lower-case continuation ("e.g. this")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])([\"'”’)\]]*)\s+(?=[\"'“‘(\[]*[^a-z\s])")
+
+
+def chunk_hash(text):
+    """Content hash of a chunk, insensitive to whitespace differences."""
+    return hashlib.sha256(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+
+def count_tokens(text):
+    return len(_TOKEN.findall(text))
+
+
+def truncate_tokens(text, max_tokens):
+    """Cut ``text`` down to a prefix of at most ``max_tokens`` tokens.
+
+    Like chunk boundaries, the cut prefers the last sentence end past half the
+    limit and otherwise falls between tokens.
+    """
+    tokens = list(_TOKEN.finditer(text))
+    if len(tokens) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    end = tokens[max_tokens - 1].end()
+    # Every span but the last ends at a sentence boundary, and the last runs
+    # to the end of the text, past the limit
+    sentence_ends = [span_end for _, span_end in sentence_spans(text) if span_end <= end]
+    if sentence_ends and count_tokens(text[:sentence_ends[-1]]) >= max_tokens // 2:
+        end = sentence_ends[-1]
+    return text[:end]
+
+
+def sentence_spans(text):
+    """Return ``(start, end)`` spans of the sentences in ``text``."""
+    spans = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        spans.append((start, match.end(1)))
+        start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+def _split_long(text, start, end, max_tokens):
+    # A single sentence over the limit is cut between words, max_tokens at a time
+    tokens = list(_TOKEN.finditer(text, start, end))
+    pieces = []
+    first = 0
+    while first < len(tokens):
+        last = min(first + max_tokens, len(tokens))
+        if last < len(tokens):
+            # Back off to a token that starts a word rather than cutting "don't" in two
+            cut = last
+            while cut > first + 1 and not text[tokens[cut].start() - 1].isspace():
+                cut -= 1
+            if cut > first + 1:
+                last = cut
+        piece_end = tokens[last - 1].end() if last < len(tokens) else end
+        pieces.append((tokens[first].start(), piece_end, last - first))
+        first = last
+    return pieces
+
+
+def _units(blocks, max_tokens):
+    # (start, end, tokens, ends_paragraph) for every sentence of a chapter, in order
+    units = []
+    for block in blocks:
+        text = block['text']
+        spans = sentence_spans(text)
+        for i, (start, end) in enumerate(spans):
+            tokens = count_tokens(text[start:end])
+            if tokens > max_tokens:
+                pieces = _split_long(text, start, end, max_tokens)
+            else:
+                pieces = [(start, end, tokens)]
+            for j, (piece_start, piece_end, piece_tokens) in enumerate(pieces):
+                last = i == len(spans) - 1 and j == len(pieces) - 1
+                units.append((block['start'] + piece_start, block['start'] + piece_end, piece_tokens, last))
+    return units
+
+
+def _chapter_chunks(blocks, max_tokens, overlap_tokens):
+    chapter_text = '\n\n'.join(block['text'] for block in blocks)
+    chapter, href = blocks[0]['chapter'], blocks[0]['href']
+    chunks = []
+
+    def emit(units):
+        start, end = units[0][0], units[-1][1]
+        chunks.append({"text": chapter_text[start:end], "chapter": chapter, "href": href,
+                       "start": start, "end": end})
+
+    current = []
+    tokens = 0
+    for unit in _units(blocks, max_tokens):
+        # A paragraph-end cut can leave more behind than still fits next to this unit;
+        # then the leftover is emitted too (it carries no overlap, so the loop always shrinks)
+        while current and tokens + unit[2] > max_tokens:
+            # Prefer to close the chunk at the last paragraph end past its midpoint
+            cut = len(current)
+            running = 0
+            for i, previous in enumerate(current):
+                running += previous[2]
+                if previous[3] and running >= max_tokens // 2 and i < len(current) - 1:
+                    cut = i + 1
+            emitted, rest = current[:cut], current[cut:]
+            emit(emitted)
+
+            # Carry trailing sentences of the emitted chunk into the next one
+            budget = min(overlap_tokens, max_tokens - unit[2] - sum(u[2] for u in rest))
+            carry = []
+            carried = 0
+            for previous in reversed(emitted):
+                if carried + previous[2] > budget:
+                    break
+                carry.insert(0, previous)
+                carried += previous[2]
+            current = carry + rest
+            tokens = sum(u[2] for u in current)
+        current.append(unit)
+        tokens += unit[2]
+    if current:
+        emit(current)
+    return chunks
+
+
+def chunk_blocks(blocks, max_tokens=160, overlap_tokens=32):
+    """Group text blocks into chunks of at most ``max_tokens`` tokens.
+
+    ``blocks`` are the dicts yielded by ``EpubPackage.iter_text_blocks``.
+    Chunks never span chapters, break only between sentences (or between words
+    for a sentence longer than the limit), prefer paragraph ends, and repeat up
+    to ``overlap_tokens`` of trailing sentences from the previous chunk. Each
+    chunk records its chapter, spine href and ``start``/``end`` offsets into the
+    chapter text.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    chunks = []
+    chapter = []
+    for block in blocks:
+        if chapter and block['chapter'] != chapter[0]['chapter']:
+            chunks.extend(_chapter_chunks(chapter, max_tokens, overlap_tokens))
+            chapter = []
+        chapter.append(block)
+    if chapter:
+        chunks.extend(_chapter_chunks(chapter, max_tokens, overlap_tokens))
+    return chunks
@@ -0,0 +1,105 @@
+import numpy as np
+
+from .chunking import count_tokens, truncate_tokens
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr(query_vector, vectors, k, lambda_=0.7):
+    """Maximal marginal relevance: pick ``k`` rows of ``vectors`` that are relevant but not redundant.
+
+    Each step takes the candidate maximising
+    ``lambda_ * sim(query, c) - (1 - lambda_) * max(sim(c, already picked))``
+    under cosine similarity. Returns row numbers in pick order.
+    """
+    if len(vectors) == 0:
+        return []
+    vectors = _normalize(np.asarray(vectors, dtype='float32'))
+    relevance = vectors @ _normalize(np.asarray(query_vector, dtype='float32').reshape(-1))
+    similarity = vectors @ vectors.T
+    selected = []
+    redundancy = np.zeros(len(vectors), dtype='float32')
+    available = np.ones(len(vectors), dtype=bool)
+    for _ in range(min(k, len(vectors))):
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def merge_adjacent(records):
+    """Merge chunks of the same chapter whose ranges overlap or touch.
+
+    ``records`` are chunk dicts in priority order; a merged record takes the
+    priority of its best member. Chunks without positions are left alone.
+    """
+    positioned = [(rank, r) for rank, r in enumerate(records) if 'href' in r]
+    merged = [(rank, r) for rank, r in enumerate(records) if 'href' not in r]
+
+    positioned.sort(key=lambda item: (item[1]['chapter'], item[1]['start']))
+    current = None
+    for rank, record in positioned:
+        if (current is not None and record['chapter'] == current[1]['chapter']
+                and record['start'] <= current[1]['end'] + 2):
+            best, span = current
+            if record['end'] > span['end']:
+                gap = record['start'] - span['end']
+                # Blocks are joined by a blank line and sentences by one space
+                joiner = '\n\n' if gap == 2 else ' ' if gap == 1 else ''
+                text = span['text'] + joiner + record['text'][max(0, -gap):]
+                span = dict(span, text=text, end=record['end'])
+            current = (min(best, rank), span)
+            continue
+        if current is not None:
+            merged.append(current)
+        current = (rank, dict(record))
+    if current is not None:
+        merged.append(current)
+
+    merged.sort(key=lambda item: item[0])
+    return [record for _, record in merged]
+
+
+def fit_budget(records, budget):
+    """Keep records in priority order while their total token count stays within ``budget``.
+
+    A first record that is over budget on its own is cut down to fit rather
+    than dropped, so the context is never empty while there is anything to use.
+    """
+    kept = []
+    used = 0
+    for record in records:
+        tokens = count_tokens(record['text'])
+        if not kept and tokens > budget > 0:
+            text = truncate_tokens(record['text'], budget)
+            record = dict(record, text=text)
+            if 'href' in record:
+                record['end'] = record['start'] + len(text)
+            tokens = count_tokens(text)
+        if used + tokens <= budget:
+            kept.append(record)
+            used += tokens
+    return kept, used
+
+
+def build_context(records, vectors, query_vector, top_k, budget, lambda_=0.7):
+    """Select, de-duplicate and trim retrieved chunks for the prompt.
+
+    ``records`` come in retrieval order, with their index vectors in
+    ``vectors`` (None when the index cannot return them, in which case
+    retrieval order is kept). Returns ``(records, tokens)`` with the records in
+    reading order where positions are known.
+    """
+    if vectors is not None:
+        records = [records[i] for i in mmr(query_vector, vectors, top_k, lambda_)]
+    else:
+        records = records[:top_k]
+    records, used = fit_budget(merge_adjacent(records), budget)
+    if all('href' in record for record in records):
+        records.sort(key=lambda record: (record['chapter'], record['start']))
+    return records, used
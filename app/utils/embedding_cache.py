@@ -0,0 +1,135 @@
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+# On-disk layout, one directory per (model, dimension):
+#   vectors.f32   float32 array of shape (capacity, dim), memory-mapped
+#   lookup.sqlite entries(hash -> slot, last_used); the row count never exceeds capacity
+# SQLite's locking doubles as a reader/writer lock for the vector file: lookups
+# copy vectors inside a read transaction and writers fill slots inside an
+# exclusive one, so no reader ever sees a slot that is being reused.
+
+
+def _model_dir(root, model_name, dim):
+    safe = re.sub(r'[^A-Za-z0-9._-]+', '_', model_name).strip('_')
+    return os.path.join(root, f"{safe}-{dim}")
+
+
+class EmbeddingCache:
+    """Persistent embeddings keyed by content hash, shared by every book and process.
+
+    Full caches evict the least recently used entries. Use as a context
+    manager; a cache is meant to be opened per ingest, not kept around.
+    """
+
+    def __init__(self, root, model_name, dim, capacity, timeout=30.0):
+        self.dim = dim
+        self.capacity = capacity
+        path = _model_dir(root, model_name, dim)
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, 'lookup.sqlite'), timeout=timeout, isolation_level=None)
+        # Readers must block writers for the whole lookup, which WAL mode would not do
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries "
+                         "(hash TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+        vectors_path = os.path.join(path, 'vectors.f32')
+        nbytes = capacity * dim * 4
+        if not os.path.exists(vectors_path) or os.path.getsize(vectors_path) != nbytes:
+            self._resize(vectors_path, nbytes)
+        self._vectors = np.memmap(vectors_path, dtype='float32', mode='r+', shape=(capacity, dim))
+
+    def _resize(self, vectors_path, nbytes):
+        # A capacity change invalidates slot numbers; start over (the file stays sparse)
+        self._db.execute("BEGIN EXCLUSIVE")
+        try:
+            if not os.path.exists(vectors_path) or os.path.getsize(vectors_path) != nbytes:
+                self._db.execute("DELETE FROM entries")
+                with open(vectors_path, 'wb') as f:
+                    f.truncate(nbytes)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def lookup(self, hashes):
+        """Return ``{hash: vector}`` for the cached ones among ``hashes``."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        self._db.execute("BEGIN")
+        try:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT hash, slot FROM entries WHERE hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for h, slot in rows:
+                    found[h] = np.array(self._vectors[slot])
+        finally:
+            self._db.execute("COMMIT")
+        return found
+
+    def store(self, hashes, vectors, touched=()):
+        """Add ``vectors`` under ``hashes`` and mark ``touched`` hashes as just used.
+
+        When the cache is full the least recently used entries make room. If a
+        single call brings more than ``capacity`` vectors, only the first
+        ``capacity`` are kept.
+        """
+        now = time.time()
+        new = {}
+        for h, vector in zip(hashes, vectors):
+            new.setdefault(h, vector)
+        victims = []
+        self._db.execute("BEGIN EXCLUSIVE")
+        try:
+            self._db.executemany("UPDATE entries SET last_used = ? WHERE hash = ?", [(now, h) for h in touched])
+            existing = set()
+            items = list(new.items())
+            for start in range(0, len(items), 500):
+                batch = [h for h, _ in items[start:start + 500]]
+                existing.update(h for (h,) in self._db.execute(
+                    f"SELECT hash FROM entries WHERE hash IN ({','.join('?' * len(batch))})", batch))
+            items = [(h, v) for h, v in items if h not in existing][:self.capacity]
+
+            # Slots are always packed: evicted slots are refilled in the same transaction
+            (count,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+            free = list(range(count, min(count + len(items), self.capacity)))
+            if len(free) < len(items):
+                victims = self._db.execute("SELECT hash, slot FROM entries ORDER BY last_used LIMIT ?",
+                                           (len(items) - len(free),)).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE hash = ?", [(h,) for h, _ in victims])
+                free += [slot for _, slot in victims]
+
+            self._db.executemany("INSERT INTO entries (hash, slot, last_used) VALUES (?, ?, ?)",
+                                 [(h, slot, now) for (h, _), slot in zip(items, free)])
+            for (h, vector), slot in zip(items, free):
+                self._vectors[slot] = vector
+            self._vectors.flush()
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            if victims:
+                # The rollback restored the victims, but their slots may already hold new vectors
+                self._db.executemany("DELETE FROM entries WHERE hash = ?", [(h,) for h, _ in victims])
+            raise
+        return len(victims)
+
+    def __len__(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return count
+
+    def close(self):
+        self._db.close()
+        del self._vectors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
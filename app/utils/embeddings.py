@@ -0,0 +1,262 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+
+
+class QueryBatcher:
+    """Coalesce concurrent single-query embeddings into one forward pass.
+
+    Callers block in ``submit`` while a background thread gathers queries for
+    up to ``max_wait_ms`` (or ``max_batch_size`` items), encodes them together
+    and hands each caller its own vector.
+    """
+
+    def __init__(self, encode, max_batch_size=32, max_wait_ms=5.0):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.batch_sizes = Counter()
+        self.queries = 0
+        self.queue_wait_total = 0.0
+
+    def _ensure_started(self):
+        # (Re)start the dispatcher lazily, and again after a fork: threads don't survive it
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='query-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, text):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                vectors = self.encode([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+            with self._lock:
+                self.batch_sizes[len(batch)] += 1
+                self.queries += len(batch)
+                self.queue_wait_total += sum(started - enqueued for _, _, enqueued in batch)
+
+    def stats(self):
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                "batches": batches,
+                "queries": self.queries,
+                "mean_batch_size": self.queries / batches if batches else 0.0,
+                "max_batch_size": max(self.batch_sizes) if self.batch_sizes else 0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "mean_queue_wait_ms": self.queue_wait_total / self.queries * 1000 if self.queries else 0.0,
+            }
+
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query, used as its cache key."""
+    return ' '.join(text.casefold().split())
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU of query string -> embedding.
+
+    Vectors live in one preallocated ``(capacity, dim)`` float32 array that is
+    filled in ring order; once it is full, the least recently used slot is
+    reused. Keys are 64-bit hashes of the query, so an entry costs a dict
+    slot plus ``dim * 4`` bytes.
+    """
+
+    def __init__(self, capacity, dim):
+        self.capacity = capacity
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype='float32')
+        self._keys = np.zeros(capacity, dtype='uint64')
+        self._last_used = np.zeros(capacity, dtype='int64')  # 0 = empty slot
+        self._slots = {}
+        self._next = 0
+        self._tick = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(text):
+        return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def get(self, text):
+        key = self._key(text)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._tick += 1
+            self._last_used[slot] = self._tick
+            self.hits += 1
+            return self._vectors[slot].copy()
+
+    def put(self, text, vector):
+        key = self._key(text)
+        with self._lock:
+            self._tick += 1
+            slot = self._slots.get(key)
+            if slot is None:
+                if self._next < self.capacity:
+                    slot = self._next
+                    self._next += 1
+                else:
+                    slot = int(np.argmin(self._last_used))
+                    del self._slots[int(self._keys[slot])]
+                    self.evictions += 1
+                self._slots[key] = slot
+                self._keys[slot] = key
+            self._vectors[slot] = vector
+            self._last_used[slot] = self._tick
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._slots),
+                "capacity": self.capacity,
+                "bytes": self._vectors.nbytes,
+            }
+
+
+class EmbeddingService:
+    """One lazily loaded SentenceTransformer per model name, shared by the whole process.
+
+    Used by both ingestion (``epub_utils``) and query embedding (``faiss_utils``)
+    so each worker holds a single copy of every model it needs.
+    """
+
+    def __init__(self, app=None):
+        self.default_model = DEFAULT_MODEL
+        self.batch_size = 64
+        self.threads = 0
+        self.device = None
+        self.batcher = None
+        self.query_cache_size = 0
+        self.query_cache = None
+        self._models = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.default_model = app.config.get('EMBEDDING_MODEL', DEFAULT_MODEL)
+        self.batch_size = app.config.get('EMBEDDING_BATCH_SIZE', 64)
+        self.threads = app.config.get('EMBEDDING_THREADS', 0)
+        self.device = app.config.get('EMBEDDING_DEVICE')
+        if app.config.get('EMBED_QUERY_BATCHING', True):
+            self.batcher = QueryBatcher(
+                self.encode,
+                max_batch_size=app.config.get('EMBED_QUERY_MAX_BATCH', 32),
+                max_wait_ms=app.config.get('EMBED_QUERY_MAX_WAIT_MS', 5.0),
+            )
+        self.query_cache_size = app.config.get('QUERY_EMBEDDING_CACHE_SIZE', 0)
+        self.query_cache = None
+        if app.config.get('EMBEDDING_WARMUP'):
+            self.warmup()
+
+    def get_model(self, model_name=None):
+        model_name = model_name or self.default_model
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    if self.threads:
+                        import torch
+                        torch.set_num_threads(self.threads)
+                    model = self._models[model_name] = SentenceTransformer(model_name, device=self.device)
+        return model
+
+    def warmup(self, model_name=None):
+        """Load the model and run one forward pass so the first request doesn't pay for it."""
+        self.encode(["warmup"], model_name)
+
+    def dimension(self, model_name=None):
+        return self.get_model(model_name).get_sentence_embedding_dimension()
+
+    def encode(self, texts, model_name=None, batch_size=None):
+        if not texts:
+            return np.empty((0, self.dimension(model_name)), dtype='float32')
+        embeddings = self.get_model(model_name).encode(
+            list(texts), batch_size=batch_size or self.batch_size, convert_to_numpy=True
+        )
+        return embeddings.astype('float32', copy=False)
+
+    def _query_cache(self):
+        # Sized on first use: the dimension is only known once the model is loaded
+        if self.query_cache is None and self.query_cache_size > 0:
+            dim = self.dimension()
+            with self._lock:
+                if self.query_cache is None:
+                    self.query_cache = QueryEmbeddingCache(self.query_cache_size, dim)
+        return self.query_cache
+
+    def encode_query(self, text, model_name=None):
+        """Embed a single query, coalesced with concurrent ones when batching is on.
+
+        Queries for the default model go through an LRU cache keyed by their
+        normalized text, so repeats (client retries, suggested questions)
+        skip the model. A miss embeds the query as given, not its cache key.
+        """
+        if model_name and model_name != self.default_model:
+            return self.encode([text], model_name)[0]
+        cache = self._query_cache()
+        key = normalize_query(text) if cache is not None else None
+        vector = cache.get(key) if cache is not None else None
+        if vector is not None:
+            return vector
+        vector = self.batcher.submit(text) if self.batcher is not None else self.encode([text])[0]
+        if cache is not None:
+            cache.put(key, vector)
+        return vector
+
+    def loaded_models(self):
+        return list(self._models)
@@ -1,7 +1,25 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.backends import default_backend
+import hashlib
+import io
 import os
+import struct
+
+# Segmented format (version 1):
+#   header  = MAGIC (4) | version (1) | segment_size (4, big-endian) | nonce_prefix (7)
+#   segment = AES-GCM(plaintext[i*segment_size:(i+1)*segment_size]) + 16 byte tag
+# The GCM nonce is nonce_prefix | segment index (4) | last-segment flag (1) and the
+# header is bound to every segment as associated data, so segments can be decrypted
+# on their own while reordering, truncation and header tampering are still detected.
+SEGMENT_MAGIC = b'HPRS'
+SEGMENT_VERSION = 1
+SEGMENT_SIZE = 64 * 1024
+SEGMENT_TAG_SIZE = 16
+SEGMENT_HEADER_SIZE = 16
+_HEADER_STRUCT = struct.Struct('>4sBI7s')
+
 
 def encrypt_file(input_data: bytes, key: bytes):
     iv = os.urandom(16)
@@ -13,6 +31,8 @@ def encrypt_file(input_data: bytes, key: bytes):
     return iv + encrypted  # Store IV at beginning
 
 def decrypt_file(encrypted_data: bytes, key: bytes):
+    if is_segmented(encrypted_data):
+        return decrypt_file_segmented(encrypted_data, key)
     iv = encrypted_data[:16]
     encrypted = encrypted_data[16:]
     cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
@@ -20,3 +40,293 @@ def decrypt_file(encrypted_data: bytes, key: bytes):
     decrypted_padded = decryptor.update(encrypted) + decryptor.finalize()
     unpadder = padding.PKCS7(128).unpadder()
     return unpadder.update(decrypted_padded) + unpadder.finalize()
+
+
+def is_segmented(data: bytes):
+    """True if ``data`` starts with a segmented-format header."""
+    return len(data) >= SEGMENT_HEADER_SIZE and data[:4] == SEGMENT_MAGIC and data[4] == SEGMENT_VERSION
+
+
+def _segment_nonce(nonce_prefix: bytes, index: int, last: bool):
+    return nonce_prefix + struct.pack('>IB', index, 1 if last else 0)
+
+
+class SegmentWriter:
+    """Incrementally encrypt a byte stream into the segmented format.
+
+    Only one segment of plaintext is buffered at a time; call ``close()``
+    to flush the final (authenticated as last) segment.
+    """
+
+    def __init__(self, out, key: bytes, segment_size: int = SEGMENT_SIZE):
+        self.out = out
+        self.segment_size = segment_size
+        self._aead = AESGCM(key)
+        self._nonce_prefix = os.urandom(7)
+        self._header = _HEADER_STRUCT.pack(SEGMENT_MAGIC, SEGMENT_VERSION, segment_size, self._nonce_prefix)
+        self._buffer = bytearray()
+        self._index = 0
+        self._closed = False
+        self.out.write(self._header)
+
+    def write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) > self.segment_size:
+            self._emit(bytes(self._buffer[:self.segment_size]), last=False)
+            del self._buffer[:self.segment_size]
+
+    def close(self):
+        if self._closed:
+            return
+        self._emit(bytes(self._buffer), last=True)
+        self._buffer = bytearray()
+        self._closed = True
+
+    def _emit(self, plaintext: bytes, last: bool):
+        nonce = _segment_nonce(self._nonce_prefix, self._index, last)
+        self.out.write(self._aead.encrypt(nonce, plaintext, self._header))
+        self._index += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class _BytesSink:
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+
+
+def encrypt_file_segmented(input_data: bytes, key: bytes, segment_size: int = SEGMENT_SIZE):
+    sink = _BytesSink()
+    with SegmentWriter(sink, key, segment_size) as writer:
+        writer.write(input_data)
+    return b''.join(sink.parts)
+
+
+class _BytesSource:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def read(self, n):
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+def decrypt_file_segmented(encrypted_data: bytes, key: bytes):
+    reader = SegmentReader(_BytesSource(encrypted_data), key, len(encrypted_data))
+    return b''.join(reader.iter_range(0, reader.size))
+
+
+class SegmentReader:
+    """Random-access reader over a segmented encrypted file.
+
+    ``size`` is the plaintext length; segments are only read from disk and
+    decrypted when a requested byte range overlaps them.
+    """
+
+    def __init__(self, f, key: bytes, file_size: int):
+        self.f = f
+        header = f.read(SEGMENT_HEADER_SIZE)
+        if not is_segmented(header):
+            raise ValueError("Not a segmented encrypted file")
+        _, _, self.segment_size, self._nonce_prefix = _HEADER_STRUCT.unpack(header)
+        self._header = header
+        self._aead = AESGCM(key)
+        self._stride = self.segment_size + SEGMENT_TAG_SIZE
+
+        body = file_size - SEGMENT_HEADER_SIZE
+        self.segment_count = max(1, -(-body // self._stride))
+        last_ct = body - (self.segment_count - 1) * self._stride
+        if last_ct < SEGMENT_TAG_SIZE:
+            raise ValueError("Truncated encrypted file")
+        self.size = (self.segment_count - 1) * self.segment_size + last_ct - SEGMENT_TAG_SIZE
+
+    def read_segment(self, index: int):
+        last = index == self.segment_count - 1
+        self.f.seek(SEGMENT_HEADER_SIZE + index * self._stride)
+        ciphertext = self.f.read(self._stride)
+        nonce = _segment_nonce(self._nonce_prefix, index, last)
+        return self._aead.decrypt(nonce, ciphertext, self._header)
+
+    def iter_range(self, start: int, end: int):
+        """Yield plaintext bytes ``[start, end)``, decrypting only covering segments."""
+        start, end = max(start, 0), min(end, self.size)
+        if start >= end:
+            return
+        first = start // self.segment_size
+        last = (end - 1) // self.segment_size
+        for index in range(first, last + 1):
+            segment = self.read_segment(index)
+            seg_start = index * self.segment_size
+            yield segment[max(start - seg_start, 0):end - seg_start]
+
+    def read_range(self, start: int, end: int):
+        return b''.join(self.iter_range(start, end))
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SegmentedFile(io.RawIOBase):
+    """Seekable, read-only file object over the plaintext of a segmented file.
+
+    Lets ``zipfile`` and friends do random access on an encrypted EPUB; only
+    the segments actually read are decrypted (the last one is kept around).
+    """
+
+    def __init__(self, reader: SegmentReader):
+        super().__init__()
+        self.reader = reader
+        self._pos = 0
+        self._segment_index = None
+        self._segment = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self.reader.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if self._pos < 0:
+            raise ValueError("Negative seek position")
+        return self._pos
+
+    def _load_segment(self, index):
+        if index != self._segment_index:
+            self._segment = self.reader.read_segment(index)
+            self._segment_index = index
+        return self._segment
+
+    def read(self, size=-1):
+        end = self.reader.size if size is None or size < 0 else min(self._pos + size, self.reader.size)
+        parts = []
+        while self._pos < end:
+            index = self._pos // self.reader.segment_size
+            offset = self._pos - index * self.reader.segment_size
+            segment = self._load_segment(index)
+            part = segment[offset:offset + end - self._pos]
+            parts.append(part)
+            self._pos += len(part)
+        return b''.join(parts)
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.reader.close()
+        super().close()
+
+
+def open_segmented(path, key: bytes):
+    f = open(path, 'rb')
+    try:
+        return SegmentReader(f, key, os.fstat(f.fileno()).st_size)
+    except Exception:
+        f.close()
+        raise
+
+
+def open_decrypted(path, key: bytes):
+    """Open an encrypted file as a seekable plaintext file object."""
+    if is_segmented_file(path):
+        return SegmentedFile(open_segmented(path, key))
+    with open(path, 'rb') as f:
+        return io.BytesIO(decrypt_file(f.read(), key))
+
+
+def encrypt_stream(src, dest_path, key: bytes, chunk_size: int = SEGMENT_SIZE):
+    """Encrypt everything readable from ``src`` into ``dest_path`` in the segmented format.
+
+    The input is read ``chunk_size`` bytes at a time and hashed on the way
+    through; the destination only appears once fully written. Returns the
+    SHA-256 hex digest of the plaintext.
+    """
+    digest = hashlib.sha256()
+    tmp_path = f"{dest_path}.part"
+    try:
+        with open(tmp_path, 'wb') as out, SegmentWriter(out, key) as writer:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                writer.write(chunk)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return digest.hexdigest()
+
+
+def is_segmented_file(path):
+    with open(path, 'rb') as f:
+        return is_segmented(f.read(SEGMENT_HEADER_SIZE))
+
+
+def iter_decrypted_file(path, key: bytes):
+    """Yield the plaintext of an encrypted file segment by segment.
+
+    Legacy single-blob CBC files cannot be split and are yielded whole.
+    """
+    if is_segmented_file(path):
+        with open_segmented(path, key) as reader:
+            for index in range(reader.segment_count):
+                yield reader.read_segment(index)
+    else:
+        with open(path, 'rb') as f:
+            yield decrypt_file(f.read(), key)
+
+
+def iter_decrypted_range(path, key: bytes, start: int, end: int):
+    """Yield plaintext bytes ``[start, end)`` of a segmented file."""
+    with open_segmented(path, key) as reader:
+        yield from reader.iter_range(start, end)
+
+
+def convert_to_segmented(path, key: bytes, segment_size: int = SEGMENT_SIZE):
+    """Rewrite a legacy CBC-encrypted file in the segmented format, in place."""
+    if is_segmented_file(path):
+        return False
+    with open(path, 'rb') as f:
+        plaintext = decrypt_file(f.read(), key)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as out, SegmentWriter(out, key, segment_size) as writer:
+        writer.write(plaintext)
+    os.replace(tmp_path, path)
+    return True
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import posixpath
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import unquote
+
+from lxml import etree
+
+# Top-level module, so parse workers can import it without the app package
+from epub_html import html_blocks
+
+DOCUMENT_TYPES = {'application/xhtml+xml', 'text/html'}
+
+
+def chapter_blocks(chapter, href, blocks):
+    """Attach chapter index, spine href and character offsets to a document's blocks.
+
+    Offsets index into the chapter text obtained by joining its blocks with
+    blank lines.
+    """
+    result = []
+    offset = 0
+    for text in blocks:
+        result.append({"chapter": chapter, "href": href, "start": offset, "end": offset + len(text), "text": text})
+        offset += len(text) + 2
+    return result
+
+
+def parse_workers(configured):
+    """Resolve a configured worker count: 0 means one per CPU this process may use."""
+    if configured > 0:
+        return configured
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _pool_context():
+    # Never fork: the parent runs torch and HTTP client threads, and a forked child
+    # can inherit one of their locks held forever. The fork server starts clean and
+    # preloads epub_html (lxml, not the app) when it can find it; workers import
+    # that module, and nothing under app, to unpickle html_blocks either way.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([html_blocks.__module__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _parse_parallel(contents, workers):
+    context = _pool_context()
+    # A few tasks per worker so one long chapter doesn't leave the others idle
+    chunksize = max(1, len(contents) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return list(pool.map(html_blocks, contents, chunksize=chunksize))
+
+
+class EpubPackage:
+    """An EPUB opened once: OPF metadata plus the spine in reading order."""
+
+    def __init__(self, epub_file):
+        self.archive = zipfile.ZipFile(epub_file)
+        container = etree.fromstring(self.archive.read('META-INF/container.xml'))
+        self.opf_path = container.xpath("//*[local-name()='rootfile']/@full-path")[0]
+        opf = etree.fromstring(self.archive.read(self.opf_path))
+        opf_dir = posixpath.dirname(self.opf_path)
+
+        self.metadata = {
+            "title": self._dc(opf, 'title', "Unknown"),
+            "author": self._dc(opf, 'creator', "Unknown"),
+            "language": self._dc(opf, 'language', "Unknown"),
+            "description": self._dc(opf, 'description', "No description"),
+        }
+
+        manifest = {}
+        for item in opf.xpath("//*[local-name()='manifest']/*[local-name()='item']"):
+            href = posixpath.normpath(posixpath.join(opf_dir, unquote(item.get('href', ''))))
+            manifest[item.get('id')] = (href, item.get('media-type'))
+
+        self.spine = []
+        for itemref in opf.xpath("//*[local-name()='spine']/*[local-name()='itemref']"):
+            entry = manifest.get(itemref.get('idref'))
+            if entry and entry[1] in DOCUMENT_TYPES:
+                self.spine.append(entry[0])
+
+    @staticmethod
+    def _dc(opf, name, default):
+        values = opf.xpath(f"//*[local-name()='metadata']/*[local-name()='{name}']/text()")
+        return values[0].strip() if values and values[0].strip() else default
+
+    def iter_documents(self):
+        """Yield ``(chapter_index, href, content)`` for each spine document."""
+        names = set(self.archive.namelist())
+        for chapter, href in enumerate(self.spine):
+            if href in names:
+                yield chapter, href, self.archive.read(href)
+
+    def spine_bytes(self):
+        """Uncompressed size of the spine documents, read from the zip directory."""
+        sizes = {info.filename: info.file_size for info in self.archive.infolist()}
+        return sum(sizes.get(href, 0) for href in self.spine)
+
+    def iter_text_blocks(self, workers=1, parallel_min_bytes=0):
+        """Yield the text blocks of every spine document, in reading order.
+
+        With ``workers`` > 1 the documents are parsed in a process pool, unless
+        the book has fewer than ``parallel_min_bytes`` of XHTML, in which case
+        starting the pool costs more than it saves.
+        """
+        workers = min(workers, len(self.spine))
+        if workers > 1 and self.spine_bytes() >= parallel_min_bytes:
+            documents = list(self.iter_documents())
+            try:
+                parsed = _parse_parallel([content for _, _, content in documents], workers)
+            except (OSError, NotImplementedError, BrokenProcessPool):
+                # No usable multiprocessing here (e.g. no /dev/shm on serverless hosts,
+                # or workers that cannot import the main module)
+                parsed = None
+            if parsed is not None:
+                for (chapter, href, _), blocks in zip(documents, parsed):
+                    yield from chapter_blocks(chapter, href, blocks)
+                return
+        for chapter, href, content in self.iter_documents():
+            yield from chapter_blocks(chapter, href, html_blocks(content))
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
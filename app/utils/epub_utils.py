@@ -1,25 +1,37 @@
 import os
 import json
+import re
+import shutil
+import struct
+import zipfile
+import zlib
 
-import ebooklib
 from flask import current_app
-from ebooklib import epub
-from bs4 import BeautifulSoup
-from sentence_transformers import SentenceTransformer
+from lxml import etree
 import faiss
+import numpy as np
 from .encryption import encrypt_file
+from .chunk_store import ChunkStore, is_chunk_store, write_chunk_store
+from .chunking import chunk_blocks, chunk_hash
+from .embedding_cache import EmbeddingCache
+from .lexical import write_lexical_index
+from .epub_text import EpubPackage, parse_workers
+from .faiss_utils import load_chunks, load_index, write_index
+from .faiss_index import (choose_index_spec, apply_encoding, build_index, with_id_map, supports_removal,
+                          reconstruct_ids, update_index)
+from .reindex import plan_reindex
+from ..extensions import embeddings as embedding_service
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
+def iter_text_blocks(package):
+    return package.iter_text_blocks(workers=parse_workers(current_app.config['EPUB_PARSE_WORKERS']),
+                                    parallel_min_bytes=current_app.config['EPUB_PARSE_PARALLEL_MIN_BYTES'])
+
 def extract_text_from_epub(epub_path):
-    book = epub.read_epub(epub_path)
-    text = ''
-    for item in book.get_items():
-        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            soup = BeautifulSoup(item.get_content(), 'html.parser')
-            text += soup.get_text() + '\n\n'
-    return text
+    with EpubPackage(epub_path) as package:
+        return '\n\n'.join(block['text'] for block in iter_text_blocks(package))
 
 def split_text(text, max_length=500):
     paragraphs = text.split('\n\n')
@@ -32,12 +44,81 @@ def split_text(text, max_length=500):
     return [chunk for chunk in chunks if chunk.strip()]
 
 
-def process_and_store_vectors(epub_path, book_id, enc_key, model_name='all-MiniLM-L6-v2'):
+def extract_cover(epub_path, book_id):
+    try:
+        with zipfile.ZipFile(epub_path, 'r') as epub:
+            # Step 1: Find content.opf using container.xml
+            container_path = 'META-INF/container.xml'
+            with epub.open(container_path) as container_file:
+                container_xml = etree.parse(container_file)
+                opf_path = container_xml.xpath("//*[local-name()='rootfile']/@full-path")[0]
+
+            # Step 2: Parse content.opf to get the cover image
+            with epub.open(opf_path) as opf_file:
+                opf_xml = etree.parse(opf_file)
+
+                # Search for cover image using 'cover' ID or properties="cover-image"
+                cover_item = opf_xml.xpath("//*[local-name()='item'][@id='cover' or @properties='cover-image']")
+
+                if not cover_item:
+                    raise Exception('Cover image not found.')
+
+                cover_href = cover_item[0].get('href')
+
+                # Ensure correct relative path
+                cover_path = os.path.join(os.path.dirname(opf_path), cover_href).replace("\\", "/")
+
+                # Step 3: Extract cover image
+                with epub.open(cover_path) as cover_file:
+                    cover_ext = os.path.splitext(cover_href)[1]
+                    cover_image_filename = f"{book_id}{cover_ext}"
+                    full_cover_image_path = os.path.join(current_app.config['IMAGE_UPLOAD_FOLDER'],
+                                                         cover_image_filename)
+
+                    with open(full_cover_image_path, 'wb') as out_file:
+                        shutil.copyfileobj(cover_file, out_file)
+
+                    return cover_image_filename
+    except Exception as e:
+        print(f"Cover extraction failed: {e}")
+        return None
+
+
+_LOCAL_HEADER = struct.Struct('<4s22sHH')
+
+
+def build_member_index(fileobj):
+    """Map each zip member to (header_offset, compress_size, file_size, compress_type).
+
+    Only the central directory at the end of the archive is read.
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        return {
+            info.filename: (info.header_offset, info.compress_size, info.file_size, info.compress_type)
+            for info in archive.infolist()
+        }
+
+
+def read_member(fileobj, entry):
+    header_offset, compress_size, file_size, compress_type = entry
+    fileobj.seek(header_offset)
+    signature, _, name_len, extra_len = _LOCAL_HEADER.unpack(fileobj.read(_LOCAL_HEADER.size))
+    if signature != b'PK\x03\x04':
+        raise ValueError("Bad zip local file header")
+    fileobj.seek(header_offset + _LOCAL_HEADER.size + name_len + extra_len)
+    data = fileobj.read(compress_size)
+    if compress_type == zipfile.ZIP_STORED:
+        return data
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.decompress(data, -15, file_size or zlib.DEF_BUF_SIZE)
+    raise ValueError(f"Unsupported compression method: {compress_type}")
+
+
+def process_and_store_vectors(epub_path, book_id, enc_key, model_name=None):
     text = extract_text_from_epub(epub_path)
     chunks = split_text(text)
 
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(chunks, convert_to_numpy=True)
+    embeddings = embedding_service.encode(chunks, model_name)
 
     index = faiss.IndexFlatL2(embeddings.shape[1])
     index.add(embeddings)
@@ -52,34 +133,166 @@ def process_and_store_vectors(epub_path, book_id, enc_key, model_name='all-MiniL
 
     # Save FAISS index
     faiss_path = os.path.join(current_app.config['FAISS_UPLOAD_FOLDER'], f"{book_id}.faiss")
-    faiss.write_index(index, faiss_path)
+    write_index(index, faiss_path)
 
-def process_and_store_vectors2(epub_path, book_id, enc_key, model_name='all-MiniLM-L6-v2'):
-    book = epub.read_epub(epub_path)
-    text = extract_text_from_epub(epub_path)
-    chunks = split_text(text)
-    metadata = get_book_metadata(book)
+def _encode_batches(texts, model_name=None, progress=None):
+    batch_size = embedding_service.batch_size
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        batches.append(embedding_service.encode(texts[start:start + batch_size], model_name))
+        if progress:
+            progress(min(start + batch_size, len(texts)), len(texts))
+    return np.concatenate(batches) if batches else embedding_service.encode([], model_name)
 
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(chunks, convert_to_numpy=True)
 
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
+def encode_chunks(chunks, model_name=None, progress=None):
+    """Embed ``chunks`` in service-sized batches, reporting ``progress(done, total)`` after each one.
 
-    # Store both metadata and chunks
-    json_data = {
-        "metadata": metadata,
-        "chunks": chunks
-    }
+    With the embedding cache on, chunks whose text was embedded before (in
+    any book) are served from it and only the rest reach the model; progress
+    then counts those alone.
+    """
+    config = current_app.config
+    if not config['EMBEDDING_CACHE'] or not chunks:
+        return _encode_batches(chunks, model_name, progress)
 
-    encrypted_json = encrypt_file(json.dumps(json_data, ensure_ascii=False).encode('utf-8'), enc_key)
+    model_name = model_name or embedding_service.default_model
+    hashes = [chunk_hash(chunk) for chunk in chunks]
+    texts = {}
+    for h, chunk in zip(hashes, chunks):
+        texts.setdefault(h, chunk)
+    with EmbeddingCache(config['EMBEDDING_CACHE_DIR'], model_name, embedding_service.dimension(model_name),
+                        config['EMBEDDING_CACHE_MAX_ENTRIES']) as cache:
+        vectors = cache.lookup(hashes)
+        # Repeated text within the book is embedded once as well
+        missing = [h for h in texts if h not in vectors]
+        embedded = _encode_batches([texts[h] for h in missing], model_name, progress)
+        evicted = cache.store(missing, embedded, touched=list(vectors))
 
-    json_path = os.path.join(current_app.config['JSON_UPLOAD_FOLDER'], f"{book_id}.json.enc")
-    with open(json_path, 'wb') as f:
-        f.write(encrypted_json)
+    hits = sum(1 for h in hashes if h in vectors)
+    vectors.update(zip(missing, embedded))
+    current_app.logger.info("Embedding cache: %d/%d chunks cached (%.1f%% hit rate), %d embedded, %d evicted",
+                            hits, len(chunks), 100.0 * hits / len(chunks), len(missing), evicted)
+    return np.stack([vectors[h] for h in hashes])
+
+
+def book_index_spec(n, d, encoding=None):
+    """The index_factory spec the per-book index gets for ``n`` chunks."""
+    config = current_app.config
+    spec = choose_index_spec(n, d, config['FAISS_INDEX_TYPE'],
+                             flat_max=config['FAISS_FLAT_MAX_CHUNKS'],
+                             hnsw_max=config['FAISS_HNSW_MAX_CHUNKS'],
+                             ivf_max=config['FAISS_IVF_MAX_CHUNKS'])
+    return with_id_map(apply_encoding(spec, encoding or config['FAISS_VECTOR_ENCODING']))
+
+
+def build_book_index(embeddings, encoding=None):
+    """Build the per-book index with the type configured for this many chunks."""
+    config = current_app.config
+    spec = book_index_spec(len(embeddings), embeddings.shape[1], encoding)
+    return build_index(embeddings, spec, nprobe=config['FAISS_NPROBE'], ef_search=config['FAISS_HNSW_EF_SEARCH'])
+
+
+def _previous_ingest(store_path, json_path, faiss_path, enc_key):
+    """Chunk texts and index from the last ingest of a book, or None if there is nothing usable."""
+    if not os.path.exists(faiss_path):
+        return None
+    if os.path.exists(store_path) and is_chunk_store(store_path):
+        store = ChunkStore(store_path, enc_key)
+        try:
+            texts = list(store)
+        finally:
+            store.close()
+    elif os.path.exists(json_path):
+        data = load_chunks(json_path, enc_key)
+        texts = data if isinstance(data, list) else data['chunks']
+    else:
+        return None
+    index, _ = load_index(faiss_path)
+    if index.ntotal != len(texts):
+        return None
+    return texts, index
+
+
+def _index_family(spec):
+    # The IVF list count follows the chunk count; a few more or fewer chunks don't change the family
+    return re.sub(r'IVF\d+', 'IVF', spec)
+
+
+def update_book_index(index, plan, new_vectors):
+    """Apply ``plan`` to the previous ingest's index, embedding nothing but ``new_vectors``.
 
+    Flat and IVF indexes are updated in place by id. HNSW cannot drop vectors,
+    and a book that crossed an index type threshold needs a different index, so
+    those are rebuilt from the stored vectors plus the new ones.
+    """
+    n = len(plan.slots)
+    same_family = _index_family(book_index_spec(n, index.d)) == _index_family(book_index_spec(index.ntotal, index.d))
+    if same_family and supports_removal(index):
+        moved = list(plan.moves)
+        vectors = np.concatenate([reconstruct_ids(index, moved), new_vectors])
+        ids = list(plan.moves.values()) + [plan.slots[i] for i in plan.embed]
+        update_index(index, plan.removed + moved, vectors, ids)
+        return index
+
+    vectors = np.empty((n, index.d), dtype='float32')
+    reused = [i for i, old_id in enumerate(plan.old_ids) if old_id is not None]
+    vectors[[plan.slots[i] for i in reused]] = reconstruct_ids(index, [plan.old_ids[i] for i in reused])
+    vectors[[plan.slots[i] for i in plan.embed]] = new_vectors
+    return build_book_index(vectors)
+
+
+def process_and_store_vectors2(epub_path, book_id, enc_key, model_name=None, progress=None):
+    """Chunk, embed and index a book, writing its chunk store and FAISS index.
+
+    If the book was ingested before (e.g. the publisher replaced the file),
+    chunks are matched to the previous ingest by content hash and only new or
+    changed ones are embedded; vectors of removed chunks are dropped from the
+    index. All artifacts are written to temp files and renamed into place.
+    """
+    # One pass over the archive for both metadata and spine text
+    with EpubPackage(epub_path) as package:
+        metadata = package.metadata
+        chunks = chunk_blocks(iter_text_blocks(package),
+                              max_tokens=current_app.config['CHUNK_MAX_TOKENS'],
+                              overlap_tokens=current_app.config['CHUNK_OVERLAP_TOKENS'])
+    texts = [chunk['text'] for chunk in chunks]
+
+    store_path = os.path.join(current_app.config['JSON_UPLOAD_FOLDER'], f"{book_id}.chunks.enc")
+    json_path = os.path.join(current_app.config['JSON_UPLOAD_FOLDER'], f"{book_id}.json.enc")
     faiss_path = os.path.join(current_app.config['FAISS_UPLOAD_FOLDER'], f"{book_id}.faiss")
-    faiss.write_index(index, faiss_path)
+
+    index = None
+    previous = _previous_ingest(store_path, json_path, faiss_path, enc_key)
+    if previous is not None and previous[1].d == embedding_service.dimension(model_name):
+        old_texts, old_index = previous
+        plan = plan_reindex([chunk_hash(text) for text in old_texts], [chunk_hash(text) for text in texts])
+        new_vectors = encode_chunks([texts[i] for i in plan.embed], model_name, progress=progress)
+        index = update_book_index(old_index, plan, new_vectors)
+
+        # Records are stored by vector id, which no longer follows reading order
+        records = [None] * len(chunks)
+        for i, slot in enumerate(plan.slots):
+            records[slot] = chunks[i]
+        chunks = records
+        current_app.logger.info("Re-indexed book %s: %d chunks, %d reused, %d embedded, %d removed",
+                                book_id, len(chunks), len(chunks) - len(plan.embed), len(plan.embed),
+                                len(plan.removed))
+
+    if index is None:
+        embeddings = encode_chunks(texts, model_name, progress=progress)
+        index = build_book_index(embeddings)
+
+    # Store metadata and chunks as individually encrypted records
+    write_chunk_store(store_path, metadata, chunks, enc_key)
+    # BM25 postings for hybrid retrieval; cheap enough to rebuild in full every time
+    write_lexical_index(os.path.join(current_app.config['FAISS_UPLOAD_FOLDER'], f"{book_id}.bm25"),
+                        [chunk['text'] for chunk in chunks], enc_key)
+    write_index(index, faiss_path)
+
+    # A chunk store supersedes any single-document JSON from older ingests
+    if os.path.exists(json_path):
+        os.remove(json_path)
 
 
 def get_book_metadata(book):
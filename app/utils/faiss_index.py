@@ -0,0 +1,166 @@
+import math
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ('auto', 'flat', 'hnsw', 'ivf', 'ivfpq')
+# How vectors are stored: plain float32, or scalar-quantized to 2 / 1 byte per dimension
+VECTOR_ENCODINGS = {'float32': 'Flat', 'fp16': 'SQfp16', 'sq8': 'SQ8'}
+
+
+def _nlist(n):
+    # ~4 * sqrt(n) lists, keeping at least 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_subquantizers(d):
+    # Largest divisor of d giving sub-vectors of at least 8 dimensions
+    for m in range(max(1, d // 8), 0, -1):
+        if d % m == 0:
+            return m
+    return 1
+
+
+def choose_index_spec(n, d, index_type='auto', flat_max=10000, hnsw_max=50000, ivf_max=500000):
+    """Return a ``faiss.index_factory`` string for ``n`` vectors of dimension ``d``.
+
+    ``index_type`` is one of ``INDEX_TYPES`` or a raw factory string. ``auto``
+    keeps an exact flat scan for ordinary books and moves to HNSW, IVF-Flat and
+    finally IVF-PQ as the chunk count crosses each threshold.
+    """
+    if index_type not in INDEX_TYPES:
+        return index_type
+    if index_type == 'auto':
+        if n < flat_max:
+            index_type = 'flat'
+        elif n < hnsw_max:
+            index_type = 'hnsw'
+        elif n < ivf_max:
+            index_type = 'ivf'
+        else:
+            index_type = 'ivfpq'
+    if index_type == 'flat' or n == 0:
+        return 'Flat'
+    if index_type == 'hnsw':
+        return 'HNSW32'
+    if index_type == 'ivf':
+        return f'IVF{_nlist(n)},Flat'
+    return f'IVF{_nlist(n)},PQ{_pq_subquantizers(d)}'
+
+
+def apply_encoding(spec, encoding='float32'):
+    """Swap the ``Flat`` vector storage of a spec for a scalar quantizer.
+
+    PQ-based and custom specs already choose their own encoding and are
+    returned unchanged.
+    """
+    codec = VECTOR_ENCODINGS[encoding]
+    if spec == 'Flat':
+        return codec
+    if spec.startswith('HNSW') and ',' not in spec:
+        return spec if codec == 'Flat' else f'{spec},{codec}'
+    if spec.startswith('IVF') and spec.endswith(',Flat'):
+        return f'{spec[:-len("Flat")]}{codec}'
+    return spec
+
+
+def index_encoding(index):
+    """Return 'float32', 'fp16', 'sq8' or 'other' for the vector storage of ``index``."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if hasattr(index, 'storage'):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return {faiss.ScalarQuantizer.QT_fp16: 'fp16', faiss.ScalarQuantizer.QT_8bit: 'sq8'}.get(index.sq.qtype, 'other')
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexIVFFlat)):
+        return 'float32'
+    return 'other'
+
+
+def with_id_map(spec):
+    """Wrap flat specs in IDMap2 so vectors can later be removed and re-added by id.
+
+    IVF indexes carry ids natively; HNSW graphs cannot remove vectors at all.
+    """
+    if spec.startswith(('Flat', 'SQ')):
+        return f'IDMap2,{spec}'
+    return spec
+
+
+def supports_removal(index):
+    return isinstance(index, faiss.IndexIDMap2) or faiss.try_extract_index_ivf(index) is not None
+
+
+def reconstruct_ids(index, ids):
+    """Return the stored vectors for ``ids`` as an (n, d) float32 array."""
+    ids = np.asarray(ids, dtype='int64')
+    if len(ids) == 0:
+        return np.empty((0, index.d), dtype='float32')
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index.reconstruct_batch(ids)
+
+
+def update_index(index, remove_ids, vectors, ids):
+    """Remove ``remove_ids`` and add ``vectors`` under ``ids``, in place.
+
+    Only valid for indexes where ``supports_removal`` is true.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    if len(remove_ids):
+        index.remove_ids(np.asarray(remove_ids, dtype='int64'))
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), np.asarray(ids, dtype='int64'))
+    if ivf is not None:
+        # Fresh builds carry no direct map; don't persist the hashtable
+        ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def extract_vectors(index):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def recall_at_k(reference, candidate, queries, k=10):
+    """Mean overlap of the top-k ids returned by ``candidate`` and ``reference``."""
+    k = min(k, reference.ntotal)
+    if k == 0 or len(queries) == 0:
+        return 1.0
+    _, expected = reference.search(queries, k)
+    _, found = candidate.search(queries, k)
+    return float(np.mean([len(set(e) & set(f)) / k for e, f in zip(expected, found)]))
+
+
+def set_search_params(index, nprobe=16, ef_search=64):
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = ef_search
+
+
+def build_index(embeddings, spec='Flat', nprobe=16, ef_search=64, max_train=100000):
+    """Build, train (if the index type needs it) and fill an index from ``embeddings``.
+
+    Vector ids are the row numbers of ``embeddings``. Search parameters are
+    stored in the index, so they survive ``write_index``.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    index = faiss.index_factory(embeddings.shape[1], spec)
+    if not index.is_trained:
+        train = embeddings
+        if len(train) > max_train:
+            train = train[np.random.default_rng(0).choice(len(train), max_train, replace=False)]
+        index.train(train)
+    if supports_removal(index):
+        index.add_with_ids(embeddings, np.arange(len(embeddings), dtype='int64'))
+    else:
+        index.add(embeddings)
+    set_search_params(index, nprobe, ef_search)
+    return index
@@ -1,10 +1,12 @@
 import json
+import os
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from .cache import get_cache
+from .chunk_store import ChunkStore, is_chunk_store
 from .encryption import decrypt_file
-
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from .lexical import LexicalIndex, reciprocal_rank_fusion
+from ..extensions import embeddings as embedding_service
 
 def load_chunks(path, enc_key):
     with open(path, 'rb') as f:
@@ -20,13 +22,139 @@ def load_chunks2(path, enc_key):
     return data['chunks'], data['metadata']
 
 
-def load_index(index_path):
-    return faiss.read_index(index_path)
+# Flat indexes need IO_FLAG_MMAP_IFC; IO_FLAG_MMAP covers IVF inverted lists on older builds
+MMAP_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _is_mapped(index):
+    # Flat codes that faiss does not own point into the mapped file; anything
+    # else (older builds, other index types) is counted as heap
+    codes = getattr(faiss.downcast_index(index), 'codes', None)
+    return codes is not None and hasattr(codes, 'is_owned') and not codes.is_owned
+
+
+def load_index(index_path, mmap=False):
+    """Read a FAISS index and return ``(index, mapped)``.
+
+    With ``mmap`` the vectors stay in the (shared) page cache when this faiss
+    build can map the index type; ``mapped`` tells whether that happened,
+    since faiss may quietly read the vectors onto the heap instead.
+    """
+    if mmap:
+        try:
+            index = faiss.read_index(index_path, MMAP_FLAGS)
+            return index, _is_mapped(index)
+        except RuntimeError:
+            pass  # index type without mmap support in this faiss build
+    return faiss.read_index(index_path), False
+
+
+def write_index(index, index_path):
+    """Write an index via a temp file and rename, so mmapped readers never see a truncated file."""
+    tmp_path = f"{index_path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+
+def _file_stamp(path):
+    # The inode changes on every os.replace, even within one mtime tick
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def index_stamp(faiss_path):
+    """Identity of the index file at ``faiss_path``; it changes whenever the index is rebuilt."""
+    return _file_stamp(faiss_path)
+
+
+def _book_size(index, chunks, mapped):
+    # Memory-mapped vectors live in the page cache, not in this worker's heap
+    vectors = 0 if mapped else index.ntotal * index.d * 4
+    if isinstance(chunks, ChunkStore):
+        return vectors + chunks.nbytes
+    return vectors + sum(len(chunk) for chunk in chunks) * 2
+
+
+def load_book(book_id, chunks_path, faiss_path, enc_key, max_bytes, mmap=False, lexical_path=None):
+    """Return ``(index, chunks, metadata, lexical)`` for a book, cached per process.
+
+    ``chunks_path`` is either a chunk store (chunks decrypted on access) or a
+    legacy ``.json.enc`` document. ``lexical`` is the book's BM25 index, or
+    None when ``lexical_path`` is not given or was never built. Entries are
+    keyed by ``book_id`` and dropped as soon as any of the files changes on
+    disk, and the files are always loaded as a matching set.
+    """
+    cache = get_cache('book_index', max_bytes)
+
+    def stamp():
+        lexical = _file_stamp(lexical_path) if lexical_path and os.path.exists(lexical_path) else None
+        return chunks_path, _file_stamp(chunks_path), _file_stamp(faiss_path), lexical
+
+    while True:
+        before = stamp()
+        entry = cache.get(book_id, before)
+        if entry is not None:
+            return entry
+        if is_chunk_store(chunks_path):
+            chunks = ChunkStore(chunks_path, enc_key)
+            metadata = chunks.metadata
+        else:
+            chunks, metadata = load_chunks2(chunks_path, enc_key)
+        index, mapped = load_index(faiss_path, mmap=mmap)
+        lexical = LexicalIndex(lexical_path, enc_key) if before[3] is not None else None
+        # A re-index renames the files into place; if any moved while we were
+        # opening them we may hold a mix of old and new files, so retry
+        if before != stamp():
+            if isinstance(chunks, ChunkStore):
+                chunks.close()
+            if lexical is not None:
+                lexical.close()
+            continue
+        entry = (index, chunks, metadata, lexical)
+        cache.put(book_id, entry, before, size=_book_size(index, chunks, mapped))
+        return entry
+
 
 def embed_query(query):
-    return model.encode([query])[0]
+    return embedding_service.encode_query(query)
+
+def search_ids(query, chunks, index, top_k=10, lexical=None, candidates=30, rrf_k=60, query_embedding=None):
+    """Ids of the ``top_k`` chunks most relevant to ``query``.
+
+    With a ``lexical`` index the ``candidates`` best vector and BM25 hits are
+    fused by reciprocal rank, so exact names and numbers that the embedding
+    blurs still surface. Pass ``query_embedding`` if the query is already embedded.
+    """
+    if query_embedding is None:
+        query_embedding = embed_query(query)
+    query_embedding = np.asarray(query_embedding, dtype='float32').reshape(1, -1)
+    k = max(top_k, candidates) if lexical is not None else top_k
+    D, I = index.search(query_embedding, k)
+    vector_ids = [int(i) for i in I[0] if 0 <= i < len(chunks)]
+    if lexical is None or len(lexical) != len(chunks):
+        return vector_ids[:top_k]
+    return reciprocal_rank_fusion([vector_ids, lexical.search(query, candidates)], k=rrf_k, top_k=top_k)
+
+def search_index(query, chunks, index, top_k=10, **kwargs):
+    # Only the returned ids are touched, so a ChunkStore decrypts just these
+    return [chunks[i] for i in search_ids(query, chunks, index, top_k, **kwargs)]
+
+def get_records(chunks, ids):
+    """Chunk dicts for ``ids``, with chapter/href/offsets when stored."""
+    if isinstance(chunks, ChunkStore):
+        return [chunks.record(i) for i in ids]
+    return [{"text": chunks[i]} for i in ids]
+
+def search_records(query, chunks, index, top_k=10, **kwargs):
+    """Like ``search_index`` but returns chunk dicts, with chapter/href/offsets when stored."""
+    return get_records(chunks, search_ids(query, chunks, index, top_k, **kwargs))
 
-def search_index(query, chunks, index, top_k=10):
-    query_embedding = embed_query(query).astype('float32').reshape(1, -1)
-    D, I = index.search(query_embedding, top_k)
-    return [chunks[i] for i in I[0] if i < len(chunks)]
+def stored_vectors(index, ids):
+    """The index's own vectors for ``ids``, or None if this index type can't return them cheaply."""
+    if not len(ids):
+        return np.empty((0, index.d), dtype='float32')
+    try:
+        return index.reconstruct_batch(np.asarray(ids, dtype='int64'))
+    except RuntimeError:
+        # IVF indexes need a direct map, which we don't build at query time
+        return None
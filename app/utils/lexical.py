@@ -0,0 +1,142 @@
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Lexical (BM25) index format (version 1), little-endian:
+#   header   = MAGIC (4) | version (1) | reserved (3) | doc count (4) | term count (4)
+#              | posting count (8) | average doc length (8, float64)
+#   terms    = term count uint64 keyed term hashes, sorted
+#   offsets  = (term count + 1) int64 offsets into the postings
+#   doc_ids  = posting count int32 chunk ids, grouped by term
+#   tfs      = posting count uint16 term frequencies, zero-padded to 8 bytes
+#   doc_lens = doc count int32 chunk lengths in tokens
+# Terms are stored as keyed BLAKE2b hashes, so the file does not reveal the
+# vocabulary of an encrypted book.
+LEXICAL_MAGIC = b'HPRB'
+LEXICAL_VERSION = 1
+_HEADER = struct.Struct('<4sB3xIIQd')
+_TOKEN = re.compile(r'\w+')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _term_hashes(terms, key):
+    return [int.from_bytes(hashlib.blake2b(term.encode('utf-8'), key=key, digest_size=8).digest(), 'little')
+            for term in terms]
+
+
+def _padded(array):
+    data = array.tobytes()
+    return data + b'\0' * (-len(data) % 8)
+
+
+def write_lexical_index(path, texts, key: bytes):
+    """Build a BM25 index over ``texts`` (chunk id = position) and write it atomically."""
+    by_term = defaultdict(list)
+    doc_lens = []
+    for doc_id, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_lens.append(sum(counts.values()))
+        for term, tf in counts.items():
+            by_term[term].append((doc_id, tf))
+
+    # Hash each distinct term once; a (vanishingly unlikely) collision just merges two terms
+    postings = defaultdict(list)
+    for term_hash, entries in zip(_term_hashes(by_term, key), by_term.values()):
+        postings[term_hash].extend(entries)
+    terms = np.array(sorted(postings), dtype='<u8')
+    offsets = np.zeros(len(terms) + 1, dtype='<i8')
+    doc_ids = []
+    tfs = []
+    for i, term_hash in enumerate(terms.tolist()):
+        entries = postings[term_hash]
+        offsets[i + 1] = offsets[i] + len(entries)
+        doc_ids.extend(doc_id for doc_id, _ in entries)
+        tfs.extend(min(tf, 0xFFFF) for _, tf in entries)
+    avgdl = sum(doc_lens) / len(doc_lens) if doc_lens else 0.0
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(LEXICAL_MAGIC, LEXICAL_VERSION, len(doc_lens), len(terms), len(doc_ids), avgdl))
+        f.write(_padded(terms))
+        f.write(_padded(offsets))
+        f.write(_padded(np.array(doc_ids, dtype='<i4')))
+        f.write(_padded(np.array(tfs, dtype='<u2')))
+        f.write(_padded(np.array(doc_lens, dtype='<i4')))
+    os.replace(tmp_path, path)
+
+
+class LexicalIndex:
+    """Memory-mapped BM25 index; loading is O(1) and queries touch only their terms' postings."""
+
+    def __init__(self, path, key: bytes):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_docs, n_terms, n_postings, avgdl = _HEADER.unpack_from(self._map)
+        if magic != LEXICAL_MAGIC or version != LEXICAL_VERSION:
+            raise ValueError("Not a lexical index")
+        self._key = key
+        self.n_docs = n_docs
+        self.avgdl = avgdl or 1.0
+
+        offset = _HEADER.size
+        arrays = []
+        for dtype, count in (('<u8', n_terms), ('<i8', n_terms + 1), ('<i4', n_postings),
+                             ('<u2', n_postings), ('<i4', n_docs)):
+            arrays.append(np.frombuffer(self._map, dtype=dtype, count=count, offset=offset))
+            offset += count * np.dtype(dtype).itemsize
+            offset += -offset % 8
+        self.terms, self.offsets, self.doc_ids, self.tfs, self.doc_lens = arrays
+
+    def __len__(self):
+        return self.n_docs
+
+    def scores(self, query):
+        """BM25 score of every chunk for ``query``, as a float32 array."""
+        scores = np.zeros(self.n_docs, dtype='float32')
+        hashes = np.array(_term_hashes(set(tokenize(query)), self._key), dtype='<u8')
+        if not len(hashes) or not len(self.terms):
+            return scores
+        positions = np.searchsorted(self.terms, hashes)
+        positions = positions[positions < len(self.terms)]
+        positions = positions[np.isin(self.terms[positions], hashes)]
+        for position in positions.tolist():
+            start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype('float32')
+            idf = math.log(1 + (self.n_docs - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lens[docs] / self.avgdl)
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=10):
+        """Ids of the ``top_k`` best-scoring chunks that match at least one query term."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        return matched[np.argsort(-scores[matched], kind='stable')].tolist()
+
+    def close(self):
+        self.terms = self.offsets = self.doc_ids = self.tfs = self.doc_lens = None
+        self._map.close()
+
+
+def reciprocal_rank_fusion(rankings, k=60, top_k=10):
+    """Fuse ranked id lists: each id scores the sum of 1 / (k + rank) over the lists it is in."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return sorted(fused, key=lambda doc_id: -fused[doc_id])[:top_k]
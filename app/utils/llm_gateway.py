@@ -0,0 +1,519 @@
+import os
+import random
+import threading
+import time
+
+import httpx
+import openai
+from openai import OpenAI
+
+from .metrics import get_histogram
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "<YOUR_SITE_URL>",  # Optional
+    "X-Title": "<YOUR_SITE_NAME>",      # Optional
+}
+# Worth retrying: rate limiting and server-side failures. Other 4xx are our own fault.
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class LLMError(Exception):
+    """The model could not answer; ``status`` is the HTTP status to report to the client."""
+
+    status = 502
+
+
+class LLMOverloaded(LLMError):
+    """No concurrency slot freed up in time."""
+
+    status = 503
+
+
+class LLMCircuitOpen(LLMError):
+    """Recent calls kept failing, so calls are refused until the breaker's cool-down ends."""
+
+    status = 503
+
+
+class LLMTimeout(LLMError):
+    """The call's deadline passed."""
+
+    status = 504
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    fail fast for ``reset_after`` seconds; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_after=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.reset_after:
+            return 'open'
+        return 'half_open'
+
+    def allow(self):
+        """Return False to refuse a call, 'closed' to let it through, or 'half_open'
+        when it is the trial call, which must end with ``end_trial``."""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return state
+            if state == 'half_open' and not self._trial:
+                self._trial = True
+                return state
+            self.rejected += 1
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_after - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+    def end_trial(self):
+        # Lets another trial through if ours ended without a verdict (a 400, a client disconnect)
+        with self._lock:
+            self._trial = False
+
+
+class _Watchdog:
+    """Closes an HTTP response once ``deadline`` passes, which ends a read in progress.
+
+    httpx timeouts apply to each read, so a body trickling in could otherwise
+    outlive the call's deadline.
+    """
+
+    def __init__(self, response, deadline):
+        self.fired = False
+        self._response = response
+        self._timer = threading.Timer(max(0.0, deadline - time.monotonic()), self._fire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _fire(self):
+        self.fired = True
+        self._response.close()
+
+    def cancel(self):
+        self._timer.cancel()
+
+
+class LLMProvider:
+    """One OpenAI-compatible chat-completions endpoint (OpenRouter, Ollama, llama.cpp's server...).
+
+    Owns one pooled HTTP client, caps concurrent upstream calls (callers
+    queue for at most ``queue_timeout`` seconds), gives every call a
+    deadline, retries rate limits and 5xx with jittered exponential backoff
+    and trips a circuit breaker when the upstream keeps failing.
+    """
+
+    def __init__(self, name, base_url, model, api_key=None, extra_headers=None,
+                 max_connections=20, max_keepalive=10, keepalive_expiry=30.0, connect_timeout=5.0,
+                 timeout=60.0, stream_timeout=180.0, max_concurrency=8, queue_timeout=10.0,
+                 max_retries=2, retry_base_delay=0.5, retry_max_delay=8.0,
+                 breaker_threshold=5, breaker_reset=30.0):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.extra_headers = extra_headers or {}
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.queued = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.overloaded = 0
+        self.timeouts = 0
+
+    def client(self):
+        # One pooled client per process; connections don't survive a fork
+        if self._client is not None and self._pid == os.getpid():
+            return self._client
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_keepalive,
+                                        keepalive_expiry=self.keepalive_expiry),
+                    timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                )
+                # Retries are ours, so they share the call's deadline and feed the breaker
+                self._client = OpenAI(base_url=self.base_url, api_key=self.api_key or 'unset',
+                                      http_client=http_client, max_retries=0)
+                self._pid = os.getpid()
+        return self._client
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+
+    def _acquire(self, deadline):
+        """Take a concurrency slot; returns whether this is the breaker's trial call."""
+        admitted = self.breaker.allow()
+        if not admitted:
+            raise LLMCircuitOpen(f"LLM circuit open for {self.name}, retry in {self.breaker.retry_after():.0f}s")
+        started = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+        try:
+            acquired = self._slots.acquire(timeout=max(0.0, min(self.queue_timeout, deadline - time.monotonic())))
+        finally:
+            with self._lock:
+                self.queued -= 1
+        get_histogram(f'llm_{self.name}_queue_wait_ms').observe((time.perf_counter() - started) * 1000)
+        if not acquired:
+            if admitted == 'half_open':
+                self.breaker.end_trial()
+            with self._lock:
+                self.overloaded += 1
+            raise LLMOverloaded(f"Too many concurrent requests to {self.name}")
+        with self._lock:
+            self.in_flight += 1
+        return admitted == 'half_open'
+
+    def _release(self, trial):
+        if trial:
+            self.breaker.end_trial()
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def _create(self, client, deadline, kwargs):
+        if kwargs.get('stream'):
+            # The caller watches the stream, which outlives this call
+            return client.chat.completions.create(**kwargs)
+        with client.chat.completions.with_streaming_response.create(**kwargs) as response:
+            watchdog = _Watchdog(response.http_response, deadline)
+            try:
+                return response.parse()
+            finally:
+                watchdog.cancel()
+
+    def _call(self, deadline, **kwargs):
+        """Create a completion, retrying retryable failures until ``deadline``.
+
+        However many attempts it takes, a call that fails counts as one
+        failure for the circuit breaker.
+        """
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self.timeouts += 1
+                self.breaker.record_failure()
+                raise LLMTimeout(f"{self.name} request deadline exceeded")
+            kwargs.setdefault('extra_headers', self.extra_headers)
+            client = self.client().with_options(
+                timeout=httpx.Timeout(remaining, connect=min(self.connect_timeout, remaining)))
+            try:
+                result = self._create(client, deadline, kwargs)
+                with self._lock:
+                    self.calls += 1
+                return result
+            except (openai.APIStatusError, openai.APIConnectionError, httpx.TransportError) as e:
+                # A TransportError here comes from reading the body, after the SDK's own handling
+                status = getattr(e, 'status_code', None)
+                retryable = status is None or status in RETRYABLE_STATUS
+                if not retryable:
+                    raise LLMError(f"{self.name} rejected the request ({status}): {e}") from e
+                with self._lock:
+                    self.failures += 1
+                delay = self._backoff(attempt, e)
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    self.breaker.record_failure()
+                    if isinstance(e, (openai.APITimeoutError, httpx.TimeoutException)) \
+                            or time.monotonic() >= deadline:
+                        with self._lock:
+                            self.timeouts += 1
+                        raise LLMTimeout(f"{self.name} request timed out") from e
+                    raise LLMError(f"{self.name} request failed: {e}") from e
+                if self.breaker.state == 'open':
+                    raise LLMCircuitOpen(f"LLM circuit for {self.name} opened while retrying") from e
+                with self._lock:
+                    self.retries += 1
+                attempt += 1
+                time.sleep(delay)
+
+    def complete(self, messages, model=None, timeout=None, **kwargs):
+        """Return the text of a chat completion, within ``timeout`` seconds (queueing included)."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        trial = self._acquire(deadline)
+        started = time.perf_counter()
+        try:
+            completion = self._call(deadline, model=model or self.model, messages=messages, **kwargs)
+            self.breaker.record_success()
+        finally:
+            self._release(trial)
+        get_histogram(f'llm_{self.name}_request_ms').observe((time.perf_counter() - started) * 1000)
+        return (completion.choices[0].message.content or '').strip()
+
+    def stream(self, messages, model=None, timeout=None, **kwargs):
+        """Yield the completion's text deltas. The concurrency slot is held until the
+        generator finishes or is closed; closing it also closes the upstream response.
+
+        Retries only happen before the first chunk, and the deadline
+        (``stream_timeout`` by default) covers the whole stream.
+        """
+        deadline = time.monotonic() + (timeout or self.stream_timeout)
+        trial = self._acquire(deadline)
+        started = time.perf_counter()
+        stream = None
+        watchdog = None
+        try:
+            stream = self._call(deadline, model=model or self.model, messages=messages, stream=True, **kwargs)
+            watchdog = _Watchdog(stream.response, deadline)
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if time.monotonic() > deadline:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise LLMTimeout(f"{self.name} stream deadline exceeded")
+            self.breaker.record_success()
+            get_histogram(f'llm_{self.name}_stream_ms').observe((time.perf_counter() - started) * 1000)
+        except (openai.APIStatusError, openai.APIConnectionError, httpx.TransportError) as e:
+            # Failed mid-stream; the deltas already sent can't be taken back, so no retry
+            self.breaker.record_failure()
+            if watchdog is not None and watchdog.fired:
+                with self._lock:
+                    self.timeouts += 1
+                raise LLMTimeout(f"{self.name} stream deadline exceeded") from e
+            with self._lock:
+                self.failures += 1
+            raise LLMError(f"{self.name} stream failed: {e}") from e
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if stream is not None:
+                stream.close()
+            self._release(trial)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "base_url": self.base_url,
+                "model": self.model,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "max_concurrency": self.max_concurrency,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "overloaded": self.overloaded,
+                "timeouts": self.timeouts,
+            }
+        stats["circuit"] = {
+            "state": self.breaker.state,
+            "opened": self.breaker.opened,
+            "rejected": self.breaker.rejected,
+        }
+        return stats
+
+
+class LLMStream:
+    """Text deltas of a streamed answer; ``provider`` names the provider answering it.
+
+    Falls over to the next provider only while nothing has been yielded yet.
+    ``close()`` closes the upstream response.
+    """
+
+    def __init__(self, gateway, providers, messages, kwargs):
+        self.provider = None
+        self._deltas = self._run(gateway, providers, messages, kwargs)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._deltas)
+
+    def close(self):
+        self._deltas.close()
+
+    def _run(self, gateway, providers, messages, kwargs):
+        for position, provider in enumerate(providers):
+            deltas = provider.stream(messages, **kwargs)
+            started = False
+            try:
+                for delta in deltas:
+                    if not started:
+                        started = True
+                        self.provider = provider.name
+                    yield delta
+                self.provider = provider.name
+                return
+            except LLMError:
+                if started or position == len(providers) - 1:
+                    raise
+                gateway.failed_over()
+            finally:
+                deltas.close()
+
+
+class LLMGateway:
+    """The process's single way out to chat-completion models.
+
+    Holds one ``LLMProvider`` per configured backend (``openrouter`` always,
+    ``local`` when LOCAL_LLM_BASE_URL is set) and routes each call to an
+    ordered list of them, chosen per book, per publisher or by default; a call
+    that fails on one provider is retried on the next.
+    """
+
+    def __init__(self, app=None):
+        self.providers = {}
+        self.default_route = []
+        self.publisher_routes = {}
+        self.book_routes = {}
+        self._lock = threading.Lock()
+        self.failovers = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        shared = dict(
+            max_connections=config.get('LLM_MAX_CONNECTIONS', 20),
+            max_keepalive=config.get('LLM_MAX_KEEPALIVE_CONNECTIONS', 10),
+            keepalive_expiry=config.get('LLM_KEEPALIVE_EXPIRY', 30.0),
+            connect_timeout=config.get('LLM_CONNECT_TIMEOUT', 5.0),
+            timeout=config.get('LLM_TIMEOUT', 60.0),
+            stream_timeout=config.get('LLM_STREAM_TIMEOUT', 180.0),
+            max_concurrency=config.get('LLM_MAX_CONCURRENCY', 8),
+            queue_timeout=config.get('LLM_QUEUE_TIMEOUT', 10.0),
+            max_retries=config.get('LLM_MAX_RETRIES', 2),
+            retry_base_delay=config.get('LLM_RETRY_BASE_DELAY', 0.5),
+            retry_max_delay=config.get('LLM_RETRY_MAX_DELAY', 8.0),
+            breaker_threshold=config.get('LLM_BREAKER_THRESHOLD', 5),
+            breaker_reset=config.get('LLM_BREAKER_RESET', 30.0),
+        )
+        providers = {
+            'openrouter': LLMProvider('openrouter', config.get('LLM_BASE_URL', DEFAULT_BASE_URL),
+                                      config.get('LLM_MODEL'), api_key=config.get('AI_API_KEY'),
+                                      extra_headers=OPENROUTER_HEADERS, **shared),
+        }
+        if config.get('LOCAL_LLM_BASE_URL'):
+            # Ollama and llama.cpp's server both speak the OpenAI API under /v1 and ignore the key
+            local = dict(shared, max_concurrency=config.get('LOCAL_LLM_MAX_CONCURRENCY', 2),
+                         timeout=config.get('LOCAL_LLM_TIMEOUT', shared['timeout']))
+            providers['local'] = LLMProvider('local', config['LOCAL_LLM_BASE_URL'], config.get('LOCAL_LLM_MODEL'),
+                                             api_key=config.get('LOCAL_LLM_API_KEY') or 'local', **local)
+
+        self.close()
+        self.providers = providers
+        self.default_route = self._parse_route(config.get('LLM_ROUTE') or 'openrouter')
+        self.publisher_routes = {str(key): self._parse_route(route)
+                                 for key, route in (config.get('LLM_PUBLISHER_ROUTES') or {}).items()}
+        self.book_routes = {str(key): self._parse_route(route)
+                            for key, route in (config.get('LLM_BOOK_ROUTES') or {}).items()}
+
+    def _parse_route(self, route):
+        names = [name.strip() for name in route.split(',') if name.strip()] if isinstance(route, str) else list(route)
+        unknown = [name for name in names if name not in self.providers]
+        if unknown or not names:
+            raise ValueError(f"Unknown LLM provider in route {route!r}; configured: {', '.join(self.providers)}")
+        return names
+
+    def route_for(self, book_id=None, publisher_id=None):
+        """Provider names to try, in order, for a book of ``publisher_id``."""
+        if book_id is not None and str(book_id) in self.book_routes:
+            return self.book_routes[str(book_id)]
+        if publisher_id is not None and str(publisher_id) in self.publisher_routes:
+            return self.publisher_routes[str(publisher_id)]
+        return self.default_route
+
+    def failed_over(self):
+        with self._lock:
+            self.failovers += 1
+
+    def complete(self, messages, route=None, **kwargs):
+        """Return ``(text, provider name)`` from the first provider in ``route`` that answers."""
+        providers = [self.providers[name] for name in (route or self.default_route)]
+        for position, provider in enumerate(providers):
+            try:
+                return provider.complete(messages, **kwargs), provider.name
+            except LLMError:
+                if position == len(providers) - 1:
+                    raise
+                self.failed_over()
+
+    def stream(self, messages, route=None, **kwargs):
+        return LLMStream(self, [self.providers[name] for name in (route or self.default_route)], messages, kwargs)
+
+    def close(self):
+        for provider in self.providers.values():
+            provider.close()
+
+    def stats(self):
+        with self._lock:
+            failovers = self.failovers
+        return {
+            "default_route": self.default_route,
+            "failovers": failovers,
+            "providers": {name: provider.stats() for name, provider in self.providers.items()},
+        }
@@ -0,0 +1,67 @@
+import bisect
+import threading
+
+# Upper bounds in milliseconds, roughly doubling: 50 ms .. 60 s
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 15000, 30000, 60000)
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram (cumulative counts per upper bound, like Prometheus)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    def _quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        target = q * self._count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self._counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def stats(self):
+        with self._lock:
+            cumulative = []
+            seen = 0
+            for count in self._counts:
+                seen += count
+                cumulative.append(seen)
+            return {
+                "buckets": {str(bound): total for bound, total in zip(self.buckets + ('+Inf',), cumulative)},
+                "count": self._count,
+                "sum": self._sum,
+                "mean": self._sum / self._count if self._count else None,
+                "p50": self._quantile(0.5) if self._count else None,
+                "p95": self._quantile(0.95) if self._count else None,
+            }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(name, buckets=LATENCY_BUCKETS_MS):
+    """Return the process-wide histogram called ``name``, creating it on first use."""
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram(buckets)
+        return histogram
+
+
+def histogram_stats():
+    with _histograms_lock:
+        histograms = dict(_histograms)
+    return {name: histogram.stats() for name, histogram in histograms.items()}
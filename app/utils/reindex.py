@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+
+class ReindexPlan:
+    """How to turn an index over ``old`` chunks into one over ``new`` chunks.
+
+    Vector ids are chunk store record numbers and stay dense (0..n-1), so:
+
+    * ``slots[i]`` is the record number / vector id of new chunk ``i``;
+    * ``old_ids[i]`` is the old vector id reused for new chunk ``i``, or None
+      when its text has no unused match in the old book;
+    * ``embed`` lists those unmatched chunks, the only ones that need the
+      embedding model;
+    * ``moves`` maps old ids of reused vectors that must be renumbered to stay
+      below ``n``, to their new ids;
+    * ``removed`` lists old ids whose chunk no longer exists.
+    """
+
+    def __init__(self, slots, old_ids, moves, removed):
+        self.slots = slots
+        self.old_ids = old_ids
+        self.embed = [i for i, old_id in enumerate(old_ids) if old_id is None]
+        self.moves = moves
+        self.removed = removed
+
+
+def plan_reindex(old_hashes, new_hashes):
+    """Match new chunks to old ones by content hash and assign dense vector ids."""
+    n = len(new_hashes)
+    unused = defaultdict(list)
+    for old_id in reversed(range(len(old_hashes))):
+        unused[old_hashes[old_id]].append(old_id)
+
+    matched = [unused[h].pop() if unused.get(h) else None for h in new_hashes]
+    kept = {old_id for old_id in matched if old_id is not None}
+    removed = [old_id for old_id in range(len(old_hashes)) if old_id not in kept]
+
+    # Ids >= n are freed up; kept vectors above the line move into the holes below it
+    holes = iter(sorted(set(range(n)) - {old_id for old_id in kept if old_id < n}))
+    slots = []
+    moves = {}
+    for old_id in matched:
+        if old_id is None:
+            slots.append(next(holes))
+        elif old_id >= n:
+            moves[old_id] = next(holes)
+            slots.append(moves[old_id])
+        else:
+            slots.append(old_id)
+    return ReindexPlan(slots, matched, moves, removed)
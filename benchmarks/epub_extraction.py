@@ -0,0 +1,111 @@
+"""Time EPUB text extraction as books grow, old vs new implementation.
+
+``legacy`` is the previous ``extract_text_from_epub`` plus the extra
+``read_epub`` for metadata (ebooklib + BeautifulSoup ``html.parser`` and
+``text +=``); ``lxml`` is ``EpubPackage`` from ``app/utils/epub_text.py``.
+Synthetic books double in size at each step, so linear scaling shows up
+as the time doubling too. ``--workers`` adds a column for the process-pool
+mode (EPUB_PARSE_WORKERS).
+
+    python benchmarks/epub_extraction.py --chapters 50 100 200 400
+    python benchmarks/epub_extraction.py --chapters 200 400 --workers 4
+"""
+import argparse
+import importlib.util
+import io
+import os
+import sys
+import time
+import zipfile
+
+import ebooklib
+from bs4 import BeautifulSoup
+from ebooklib import epub
+
+# Load app/utils/epub_text.py on its own: importing the ``app`` package would
+# start the whole Flask app (config, database, models). The repository root
+# goes on sys.path for epub_html, which the process pool workers import.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+_spec = importlib.util.spec_from_file_location(
+    'epub_text', os.path.join(os.path.dirname(__file__), '..', 'app', 'utils', 'epub_text.py'))
+epub_text = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(epub_text)
+
+PARAGRAPH = ("It was the best of times, it was the worst of times, it was the age of wisdom, "
+             "it was the age of foolishness, it was the epoch of belief. ")
+
+
+def make_epub(chapters, paragraphs=60):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        z.writestr('META-INF/container.xml',
+                   '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                   '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                   '</rootfiles></container>')
+        items = ''.join(f'<item id="c{i}" href="c{i}.xhtml" media-type="application/xhtml+xml"/>' for i in range(chapters))
+        spine = ''.join(f'<itemref idref="c{i}"/>' for i in range(chapters))
+        z.writestr('OEBPS/content.opf',
+                   '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+                   '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:identifier id="id">bench</dc:identifier>'
+                   '<dc:title>Bench</dc:title><dc:language>en</dc:language></metadata>'
+                   f'<manifest>{items}</manifest><spine>{spine}</spine></package>')
+        body = ''.join(f'<p>{i}. {PARAGRAPH * 3}<em>emphasis</em> {PARAGRAPH}</p>' for i in range(paragraphs))
+        for i in range(chapters):
+            z.writestr(f'OEBPS/c{i}.xhtml',
+                       '<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml">'
+                       f'<head><title>{i}</title></head><body><h1>Chapter {i}</h1>{body}</body></html>')
+    return buf.getvalue()
+
+
+def legacy(data):
+    book = epub.read_epub(io.BytesIO(data))
+    book.get_metadata('DC', 'title')
+    book = epub.read_epub(io.BytesIO(data))
+    text = ''
+    for item in book.get_items():
+        if item.get_type() == ebooklib.ITEM_DOCUMENT:
+            soup = BeautifulSoup(item.get_content(), 'html.parser')
+            text += soup.get_text() + '\n\n'
+    return len(text)
+
+
+def current(data, workers=1):
+    with epub_text.EpubPackage(io.BytesIO(data)) as package:
+        return sum(len(block['text']) for block in package.iter_text_blocks(workers=workers))
+
+
+def best_of(fn, data, repeat, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chapters', type=int, nargs='*', default=[25, 50, 100, 200])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=0, help='also time the process pool with N workers')
+    args = parser.parse_args()
+
+    header = f"{'chapters':>8} {'text MB':>8} {'legacy s':>9} {'lxml s':>8} {'speedup':>8} {'lxml MB/s':>10}"
+    if args.workers > 1:
+        header += f" {f'x{args.workers} s':>8} {'speedup':>8}"
+    print(header)
+    for chapters in args.chapters:
+        data = make_epub(chapters)
+        text_mb = current(data) / 2**20
+        old = best_of(legacy, data, args.repeat)
+        new = best_of(current, data, args.repeat)
+        row = f"{chapters:>8} {text_mb:>8.1f} {old:>9.3f} {new:>8.3f} {old / new:>7.1f}x {text_mb / new:>10.1f}"
+        if args.workers > 1:
+            parallel = best_of(current, data, args.repeat, workers=args.workers)
+            row += f" {parallel:>8.3f} {new / parallel:>7.1f}x"
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Recall@10 and latency of the per-book index types against the exact flat baseline.
+
+Uses the same ``choose_index_spec``/``build_index`` as ingestion, so the
+thresholds in ``Config`` (FAISS_*_MAX_CHUNKS, FAISS_NPROBE, ...) can be picked
+from the numbers printed here. Vectors are synthetic clustered unit vectors
+unless ``--embeddings`` points at a real (n, d) float32 ``.npy`` dump.
+
+    python benchmarks/faiss_index_types.py --vectors 100000
+    python benchmarks/faiss_index_types.py --embeddings book.npy --specs Flat HNSW32 IVF1024,Flat
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import time
+
+import faiss
+import numpy as np
+
+# Load app/utils/faiss_index.py on its own: importing the ``app`` package would
+# start the whole Flask app (config, database, models).
+_spec = importlib.util.spec_from_file_location(
+    'faiss_index', os.path.join(os.path.dirname(__file__), '..', 'app', 'utils', 'faiss_index.py'))
+faiss_index = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(faiss_index)
+
+
+def synthetic(n, d, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, d), dtype='float32')
+    x = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, d), dtype='float32')
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def evaluate(xb, xq, ground_truth, spec, nprobe, ef_search, k=10):
+    start = time.perf_counter()
+    index = faiss_index.build_index(xb, spec, nprobe=nprobe, ef_search=ef_search)
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    found = []
+    for i in range(len(xq)):
+        start = time.perf_counter()
+        _, ids = index.search(xq[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    recall = statistics.mean(len(set(f) & set(g)) / k for f, g in zip(found, ground_truth))
+    latencies.sort()
+    return {
+        'build_s': build_s,
+        'recall': recall,
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': latencies[max(0, int(len(latencies) * 0.99) - 1)],
+        'size_mb': faiss.serialize_index(index).nbytes / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--embeddings', help='.npy file with real chunk embeddings')
+    parser.add_argument('--specs', nargs='*', help='index_factory strings or flat/hnsw/ivf/ivfpq/auto')
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--ef-search', type=int, default=64)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        data = np.load(args.embeddings).astype('float32')
+    else:
+        data = synthetic(args.vectors + args.queries, args.dim)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(data))
+    xq, xb = data[order[:args.queries]], data[order[args.queries:]]
+    n, d = xb.shape
+
+    flat = faiss.IndexFlatL2(d)
+    flat.add(xb)
+    _, ground_truth = flat.search(xq, 10)
+
+    specs = args.specs or ['flat', 'hnsw', 'ivf', 'ivfpq', 'auto']
+    print(f"{n} vectors x {d}, {len(xq)} queries, nprobe={args.nprobe}, efSearch={args.ef_search}")
+    print(f"{'spec':<18} {'build s':>8} {'recall@10':>10} {'p50 ms':>8} {'p99 ms':>8} {'size MB':>8}")
+    for name in specs:
+        spec = faiss_index.choose_index_spec(n, d, name)
+        row = evaluate(xb, xq, ground_truth, spec, args.nprobe, args.ef_search)
+        label = f"{spec} (auto)" if name == 'auto' else spec
+        print(f"{label:<18} {row['build_s']:>8.2f} {row['recall']:>10.3f} {row['p50_ms']:>8.3f} "
+              f"{row['p99_ms']:>8.3f} {row['size_mb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
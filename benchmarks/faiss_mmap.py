@@ -0,0 +1,111 @@
+"""Compare heap-loaded and memory-mapped FAISS indexes across worker processes.
+
+Builds a synthetic flat index, then starts N processes per mode that each
+load it the way ``faiss_utils.load_index`` does, run one cold and many warm
+queries, and report their memory. PSS (proportional set size) splits shared
+pages between the processes mapping them, so the summed PSS is what the
+workers really cost together; RSS counts shared pages once per process.
+
+    python benchmarks/faiss_mmap.py --vectors 200000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+MMAP_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _memory_kb():
+    values = {}
+    for name in ('/proc/self/status', '/proc/self/smaps_rollup'):
+        try:
+            with open(name) as f:
+                for line in f:
+                    key, _, rest = line.partition(':')
+                    if key in ('VmRSS', 'Pss'):
+                        values[key] = int(rest.split()[0])
+        except OSError:
+            pass
+    return values.get('VmRSS', 0), values.get('Pss', 0)
+
+
+def _worker(path, mode, dim, queries, barrier, results):
+    rng = np.random.default_rng(os.getpid())
+    xq = rng.random((queries, dim), dtype='float32')
+
+    start = time.perf_counter()
+    index = faiss.read_index(path, MMAP_FLAGS) if mode == 'mmap' else faiss.read_index(path)
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.search(xq[:1], 10)
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for i in range(1, queries):
+        start = time.perf_counter()
+        index.search(xq[i:i + 1], 10)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Measure while every worker still holds its index
+    barrier.wait()
+    rss, pss = _memory_kb()
+    barrier.wait()
+    latencies.sort()
+    results.put({
+        'load_s': load_s,
+        'cold_ms': cold_ms,
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1],
+        'rss_mb': rss / 1024,
+        'pss_mb': pss / 1024,
+    })
+
+
+def run(path, mode, workers, dim, queries):
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(path, mode, dim, queries, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vectors', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.faiss')
+        index = faiss.IndexFlatL2(args.dim)
+        index.add(np.random.default_rng(0).random((args.vectors, args.dim), dtype='float32'))
+        faiss.write_index(index, path)
+        del index
+        print(f"index: {args.vectors} x {args.dim} float32 = {os.path.getsize(path) / 2**20:.0f} MB, "
+              f"{args.workers} workers")
+        print(f"{'mode':<6} {'load s':>7} {'cold ms':>8} {'p50 ms':>7} {'p99 ms':>7} "
+              f"{'RSS/worker MB':>14} {'sum PSS MB':>11}")
+        for mode in ('heap', 'mmap'):
+            rows = run(path, mode, args.workers, args.dim, args.queries)
+            mean = lambda key: statistics.mean(row[key] for row in rows)
+            print(f"{mode:<6} {mean('load_s'):>7.3f} {mean('cold_ms'):>8.2f} {mean('p50_ms'):>7.2f} "
+                  f"{mean('p99_ms'):>7.2f} {mean('rss_mb'):>14.0f} {sum(row['pss_mb'] for row in rows):>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Load-test ``LLMGateway`` against the local stub server, fully offline.
+
+Starts ``llm_stub_server`` in-process (or uses ``--url``), fires
+``--requests`` chat completions from ``--clients`` threads through one
+gateway configured like the app (LLM_* settings as flags), and reports
+end-to-end latency, outcomes, which provider answered, the gateway's
+counters and its queue-wait histogram. ``--fallback`` adds a second,
+healthy stub as the "local" provider and routes "openrouter,local", to
+watch failover while the first one is failing.
+
+    python benchmarks/llm_gateway_load.py --clients 32 --max-concurrency 8 --error-rate 0.1
+    python benchmarks/llm_gateway_load.py --stream --rate-limit-rate 0.2 --retry-after 0
+    python benchmarks/llm_gateway_load.py --error-rate 1 --max-retries 0 --fallback
+"""
+import argparse
+import importlib
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+import llm_stub_server  # noqa: E402
+
+# Load app/utils as a package of its own: importing the ``app`` package would
+# start the whole Flask app (config, database, models).
+_utils = types.ModuleType('app_utils')
+_utils.__path__ = [os.path.join(os.path.dirname(__file__), '..', 'app', 'utils')]
+sys.modules['app_utils'] = _utils
+llm_gateway = importlib.import_module('app_utils.llm_gateway')
+metrics = importlib.import_module('app_utils.metrics')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="use a running server instead of the in-process stub")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--max-concurrency', type=int, default=8)
+    parser.add_argument('--max-connections', type=int, default=20)
+    parser.add_argument('--queue-timeout', type=float, default=10.0)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--max-retries', type=int, default=2)
+    parser.add_argument('--retry-base-delay', type=float, default=0.2)
+    parser.add_argument('--breaker-threshold', type=int, default=5)
+    parser.add_argument('--breaker-reset', type=float, default=5.0)
+    parser.add_argument('--fallback', action='store_true', help="fail over to a healthy local stub")
+    llm_stub_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = llm_stub_server.serve(settings=llm_stub_server.settings_from_args(args))
+        url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    config = {
+        'LLM_BASE_URL': url, 'AI_API_KEY': 'stub', 'LLM_MODEL': 'stub',
+        'LLM_MAX_CONCURRENCY': args.max_concurrency, 'LLM_MAX_CONNECTIONS': args.max_connections,
+        'LLM_QUEUE_TIMEOUT': args.queue_timeout, 'LLM_TIMEOUT': args.timeout, 'LLM_STREAM_TIMEOUT': args.timeout,
+        'LLM_MAX_RETRIES': args.max_retries, 'LLM_RETRY_BASE_DELAY': args.retry_base_delay,
+        'LLM_BREAKER_THRESHOLD': args.breaker_threshold, 'LLM_BREAKER_RESET': args.breaker_reset,
+    }
+    fallback = None
+    if args.fallback:
+        fallback = llm_stub_server.serve(settings=llm_stub_server.StubSettings(
+            latency_ms=args.latency_ms, token_delay_ms=args.token_delay_ms, tokens=args.tokens))
+        config.update(LOCAL_LLM_BASE_URL=f"http://127.0.0.1:{fallback.server_address[1]}/v1",
+                      LOCAL_LLM_MODEL='stub', LOCAL_LLM_MAX_CONCURRENCY=args.max_concurrency,
+                      LLM_ROUTE='openrouter,local')
+    gateway = llm_gateway.LLMGateway(types.SimpleNamespace(config=config))
+    messages = [{"role": "user", "content": "Who is the main character?"}]
+    outcomes = Counter()
+    providers = Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            if args.stream:
+                deltas = gateway.stream(messages)
+                ''.join(deltas)
+                provider = deltas.provider
+            else:
+                _, provider = gateway.complete(messages)
+            outcome = 'ok'
+        except llm_gateway.LLMError as e:
+            outcome, provider = type(e).__name__, None
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            outcomes[outcome] += 1
+            providers[provider] += 1
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as pool:
+        list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{args.requests} requests from {args.clients} clients in {wall:.1f}s "
+          f"({args.requests / wall:.1f} req/s)")
+    print(f"latency ms: p50 {statistics.median(latencies):.0f}  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.0f}  max {latencies[-1]:.0f}")
+    print("outcomes:", dict(outcomes))
+    print("answered by:", dict(providers))
+    print("gateway:", json.dumps(gateway.stats()))
+    queue_wait = metrics.histogram_stats().get('llm_openrouter_queue_wait_ms', {})
+    print(f"queue wait ms: mean {queue_wait.get('mean') or 0:.1f}  p95 <= {queue_wait.get('p95')}")
+    if server is not None:
+        print("stub:", server.RequestHandlerClass.settings.counts)
+        server.shutdown()
+    if fallback is not None:
+        fallback.shutdown()
+    gateway.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Local OpenAI-compatible chat-completions server with injectable latency and failures.
+
+Answers ``POST /v1/chat/completions`` (plain and ``stream: true``) and
+``GET /v1/models`` with canned text, so the ask path can be exercised and
+load-tested without network or API keys. Point the app at it with
+``LLM_BASE_URL=http://127.0.0.1:8089/v1``.
+
+Each request independently draws its fate: a 429 with ``Retry-After``
+(``--rate-limit-rate``), an HTTP error (``--error-rate``, ``--error-status``),
+a hang that outlives any sane client timeout (``--hang-rate``), or a normal
+answer after ``--latency-ms`` (plus up to ``--jitter-ms``), streamed at
+``--token-delay-ms`` per token.
+
+    python benchmarks/llm_stub_server.py --port 8089 --latency-ms 400 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = ("Based on the book content provided, the answer is in the passages above: "
+          "the main character returns home in the final chapter and the story ends there.")
+
+
+class StubSettings:
+    def __init__(self, latency_ms=200.0, jitter_ms=0.0, token_delay_ms=20.0, tokens=40,
+                 error_rate=0.0, error_status=503, rate_limit_rate=0.0, retry_after=1,
+                 hang_rate=0.0, hang_s=300.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_delay_ms = token_delay_ms
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'ok': 0, 'rate_limited': 0, 'errors': 0, 'hangs': 0, 'disconnects': 0}
+
+    def fate(self):
+        with self.lock:
+            draw = self.random.random()
+        for name, rate in (('rate_limited', self.rate_limit_rate), ('errors', self.error_rate),
+                           ('hangs', self.hang_rate)):
+            if draw < rate:
+                return name
+            draw -= rate
+        return 'ok'
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+def _words(n):
+    words = ANSWER.split(' ')
+    return [words[i % len(words)] + ' ' for i in range(n)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = StubSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        # Clients drop keep-alive connections at will (e.g. closing a stream early)
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _json(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._json(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+        else:
+            self._json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._json(404, {"error": {"message": "Not found"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        settings = self.settings
+        fate = settings.fate()
+        settings.count(fate)
+        if fate == 'rate_limited':
+            self._json(429, {"error": {"message": "Rate limit exceeded", "code": 429}},
+                       headers=[('Retry-After', str(settings.retry_after))])
+            return
+        if fate == 'errors':
+            self._json(settings.error_status, {"error": {"message": "Injected failure",
+                                                         "code": settings.error_status}})
+            return
+        if fate == 'hangs':
+            time.sleep(settings.hang_s)
+            return
+
+        time.sleep((settings.latency_ms + settings.random.random() * settings.jitter_ms) / 1000)
+        model = body.get('model') or 'stub'
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        words = _words(settings.tokens)
+        try:
+            if not body.get('stream'):
+                self._json(200, {
+                    "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": ''.join(words).strip()}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+                })
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i, word in enumerate(words):
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {"content": word},
+                                                      "finish_reason": "stop" if i == len(words) - 1 else None}]}
+                self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                time.sleep(settings.token_delay_ms / 1000)
+            self._chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            settings.count('disconnects')
+
+
+def serve(host='127.0.0.1', port=0, settings=None):
+    """Start the stub in a background thread and return the server; its port is ``server_address[1]``."""
+    handler = type('Handler', (StubHandler,), {'settings': settings or StubSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='llm-stub', daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=200.0, help="time to first byte")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="random extra latency, up to this much")
+    parser.add_argument('--token-delay-ms', type=float, default=20.0, help="gap between streamed tokens")
+    parser.add_argument('--tokens', type=int, default=40, help="answer length")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int)
+
+
+def settings_from_args(args):
+    return StubSettings(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, token_delay_ms=args.token_delay_ms,
+                        tokens=args.tokens, error_rate=args.error_rate, error_status=args.error_status,
+                        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                        hang_rate=args.hang_rate, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    settings = settings_from_args(args)
+    server = serve(args.host, args.port, settings)
+    print(f"Stub LLM listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(10)
+            print(settings.counts, flush=True)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
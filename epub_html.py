@@ -0,0 +1,59 @@
+"""HTML-to-text-blocks parsing for EPUB spine documents.
+
+Lives outside the ``app`` package on purpose: EPUB parse workers import it
+by name, and importing anything under ``app`` runs ``app/__init__`` (config,
+database models, the embedding model). This module needs nothing but lxml.
+"""
+from lxml import etree, html
+
+# Elements that start a new block of text
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'caption', 'dd', 'div', 'dl', 'dt', 'figcaption',
+    'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav',
+    'ol', 'p', 'pre', 'section', 'table', 'td', 'th', 'tr', 'ul',
+}
+SKIP_TAGS = ('script', 'style', 'head', 'title')
+
+
+def html_blocks(content):
+    """Split one XHTML/HTML document into whitespace-normalised text blocks, in order.
+
+    Walks the parsed tree once, so the cost is linear in the document size.
+    """
+    if not content or not content.strip():
+        return []
+    try:
+        root = html.document_fromstring(content)
+    except (etree.ParserError, ValueError):
+        return []
+    etree.strip_elements(root, *SKIP_TAGS, with_tail=False)
+    etree.strip_tags(root, etree.Comment, etree.ProcessingInstruction)
+    body = root.find('body')
+    if body is None:
+        body = root
+
+    blocks = []
+    parts = []
+
+    def flush():
+        text = ' '.join(''.join(parts).split())
+        if text:
+            blocks.append(text)
+        parts.clear()
+
+    for event, element in etree.iterwalk(body, events=('start', 'end')):
+        tag = element.tag if isinstance(element.tag, str) else ''
+        if event == 'start':
+            if tag in BLOCK_TAGS:
+                flush()
+            elif tag == 'br':
+                parts.append(' ')
+            if element.text:
+                parts.append(element.text)
+        else:
+            if tag in BLOCK_TAGS:
+                flush()
+            if element.tail and element is not body:
+                parts.append(element.tail)
+    flush()
+    return blocks
@@ -0,0 +1,13 @@
+"""Shared test setup.
+
+app/utils is registered as a package of its own, ``app_utils``: importing the
+``app`` package would start the whole Flask app (config, database, models).
+Tests import the modules they cover with ``from app_utils import ...``.
+"""
+import os
+import sys
+import types
+
+_utils = types.ModuleType('app_utils')
+_utils.__path__ = [os.path.join(os.path.dirname(__file__), '..', 'app', 'utils')]
+sys.modules['app_utils'] = _utils
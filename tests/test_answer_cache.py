@@ -0,0 +1,88 @@
+"""Tests for app/utils/answer_cache.py."""
+import types
+
+import numpy as np
+import pytest
+
+from app_utils import answer_cache
+
+STAMP = (1, 100, 4096)
+
+
+def _vector(*values):
+    vector = np.zeros(8, dtype='float32')
+    vector[:len(values)] = values
+    return vector
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_similar_question_hits():
+    cache = answer_cache.SemanticAnswerCache(threshold=0.9)
+    cache.store('1', STAMP, _vector(1, 0.1), "Who is the hero?", {"response": "Ann"})
+    payload, similarity = cache.lookup('1', STAMP, _vector(1, 0.12), "who's the hero")
+    assert payload == {"response": "Ann"}
+    assert similarity >= 0.9
+    assert cache.stats()["hits"] == 1
+
+
+def test_dissimilar_question_and_other_book_miss():
+    cache = answer_cache.SemanticAnswerCache(threshold=0.9)
+    cache.store('1', STAMP, _vector(1, 0), "Who is the hero?", {"response": "Ann"})
+    assert cache.lookup('1', STAMP, _vector(0, 1), "Where does it end?") is None
+    assert cache.lookup('2', STAMP, _vector(1, 0), "Who is the hero?") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_numbers_must_match():
+    cache = answer_cache.SemanticAnswerCache(threshold=0.9)
+    cache.store('1', STAMP, _vector(1, 0), "Summarise chapter 1", {"response": "one"})
+    cache.store('1', STAMP, _vector(1, 0.01), "Summarise chapter 2", {"response": "two"})
+    assert cache.lookup('1', STAMP, _vector(1, 0), "Summarise chapter 2")[0] == {"response": "two"}
+    assert cache.lookup('1', STAMP, _vector(1, 0), "Summarise chapter 3") is None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = answer_cache.SemanticAnswerCache(threshold=0.9, ttl=60)
+    cache.store('1', STAMP, _vector(1, 0), "Who is the hero?", {"response": "Ann"})
+    clock[0] += 59
+    assert cache.lookup('1', STAMP, _vector(1, 0), "Who is the hero?") is not None
+    clock[0] += 2
+    assert cache.lookup('1', STAMP, _vector(1, 0), "Who is the hero?") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_oldest_entries_and_least_recent_books_are_evicted():
+    cache = answer_cache.SemanticAnswerCache(threshold=0.99, max_entries=2, max_books=2)
+    for i, vector in enumerate((_vector(1, 0), _vector(0, 1), _vector(0, 0, 1))):
+        cache.store('1', STAMP, vector, "Question?", {"response": i})
+    assert cache.lookup('1', STAMP, _vector(1, 0), "Question?") is None
+    assert cache.lookup('1', STAMP, _vector(0, 0, 1), "Question?")[0] == {"response": 2}
+
+    cache.store('2', STAMP, _vector(1, 0), "Question?", {"response": "b2"})
+    # Book 1 was used more recently than book 2, so book 2 goes when book 3 arrives
+    cache.lookup('1', STAMP, _vector(0, 1), "Question?")
+    cache.store('3', STAMP, _vector(1, 0), "Question?", {"response": "b3"})
+    assert cache.lookup('2', STAMP, _vector(1, 0), "Question?") is None
+    assert cache.lookup('1', STAMP, _vector(0, 1), "Question?")[0] == {"response": 1}
+    assert cache.stats()["books"] == 2
+
+
+def test_new_index_stamp_drops_the_book():
+    cache = answer_cache.SemanticAnswerCache(threshold=0.9)
+    cache.store('1', STAMP, _vector(1, 0), "Who is the hero?", {"response": "Ann"})
+    assert cache.lookup('1', (2, 200, 4096), _vector(1, 0), "Who is the hero?") is None
+    assert cache.lookup('1', STAMP, _vector(1, 0), "Who is the hero?") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_invalidate():
+    cache = answer_cache.SemanticAnswerCache(threshold=0.9)
+    cache.store('1', STAMP, _vector(1, 0), "Who is the hero?", {"response": "Ann"})
+    cache.invalidate('1')
+    assert cache.lookup('1', STAMP, _vector(1, 0), "Who is the hero?") is None
@@ -0,0 +1,66 @@
+"""Tests for app/utils/chunking.py."""
+import random
+
+import pytest
+
+from app_utils import chunking
+
+
+def _blocks(paragraphs, chapter=0):
+    blocks = []
+    start = 0
+    for text in paragraphs:
+        blocks.append({"text": text, "chapter": chapter, "href": f"c{chapter}.xhtml", "start": start})
+        start += len(text) + 2
+    return blocks
+
+
+def _random_paragraph(rng):
+    sentences = []
+    for _ in range(rng.randint(1, 6)):
+        word = rng.choice(['Aa', 'Bb', 'Cc', 'Dd'])
+        sentences.append(' '.join([word] * rng.randint(1, 14)) + rng.choice(['.', '!', '?']))
+    return ' '.join(sentences)
+
+
+def test_paragraph_cut_leftover_does_not_overflow():
+    # The first chunk closes after paragraph one; the 5 tokens left over plus the last paragraph make 11
+    blocks = _blocks(["Bb Bb Bb Bb.", "Aa. Dd Dd.", "Dd Dd Dd Dd Dd."])
+    chunks = chunking.chunk_blocks(blocks, max_tokens=10, overlap_tokens=2)
+    assert all(chunking.count_tokens(chunk['text']) <= 10 for chunk in chunks)
+
+
+@pytest.mark.parametrize('max_tokens,overlap_tokens', [(10, 2), (16, 4), (24, 8), (40, 0), (160, 32)])
+def test_chunks_never_exceed_max_tokens(max_tokens, overlap_tokens):
+    rng = random.Random(max_tokens)
+    for _ in range(50):
+        blocks = _blocks([_random_paragraph(rng) for _ in range(rng.randint(1, 8))])
+        chunks = chunking.chunk_blocks(blocks, max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+        for chunk in chunks:
+            assert chunking.count_tokens(chunk['text']) <= max_tokens
+
+
+def test_chunks_cover_the_chapter_text():
+    rng = random.Random(1)
+    paragraphs = [_random_paragraph(rng) for _ in range(6)]
+    chapter_text = '\n\n'.join(paragraphs)
+    chunks = chunking.chunk_blocks(_blocks(paragraphs), max_tokens=16, overlap_tokens=4)
+    for chunk in chunks:
+        assert chapter_text[chunk['start']:chunk['end']] == chunk['text']
+    covered = set()
+    for chunk in chunks:
+        covered.update(range(chunk['start'], chunk['end']))
+    assert all(i in covered for i, ch in enumerate(chapter_text) if not ch.isspace())
+
+
+def test_truncate_tokens_prefers_a_sentence_end():
+    text = "Aa aa aa aa. Bb bb bb bb bb bb."
+    assert chunking.truncate_tokens(text, 8) == "Aa aa aa aa."
+    assert chunking.truncate_tokens(text, 20) == text
+
+
+def test_truncate_tokens_cuts_between_tokens_without_a_late_sentence_end():
+    text = "Aa. Bb bb bb bb bb bb bb bb bb."
+    truncated = chunking.truncate_tokens(text, 6)
+    assert truncated == "Aa. Bb bb bb bb"
+    assert chunking.count_tokens(truncated) == 6
@@ -0,0 +1,37 @@
+"""Tests for app/utils/context.py."""
+from app_utils import chunking, context
+
+CHAPTER = "Aa aa aa aa. Bb bb bb bb bb bb. Cc cc cc cc cc cc cc cc."
+
+
+def _record(start, end):
+    return {"text": CHAPTER[start:end], "chapter": 0, "href": "c0.xhtml", "start": start, "end": end}
+
+
+def test_fit_budget_keeps_records_in_priority_order():
+    first, second = _record(0, 12), _record(13, 31)
+    kept, used = context.fit_budget([first, second], 20)
+    assert kept == [first, second]
+    assert used == 5 + 7
+
+
+def test_fit_budget_skips_records_that_do_not_fit():
+    first, second, third = _record(0, 12), _record(32, 56), _record(13, 31)
+    kept, used = context.fit_budget([first, second, third], 13)
+    assert kept == [first, third]
+    assert used == 12
+
+
+def test_fit_budget_truncates_an_oversized_first_record():
+    whole = _record(0, len(CHAPTER))
+    kept, used = context.fit_budget([whole, _record(0, 12)], 14)
+    assert len(kept) == 1
+    record = kept[0]
+    assert record['text'] == "Aa aa aa aa. Bb bb bb bb bb bb."
+    assert CHAPTER[record['start']:record['end']] == record['text']
+    assert used == chunking.count_tokens(record['text']) <= 14
+    assert whole['end'] == len(CHAPTER)
+
+
+def test_fit_budget_with_no_budget_keeps_nothing():
+    assert context.fit_budget([_record(0, 12)], 0) == ([], 0)
@@ -0,0 +1,32 @@
+"""Tests for app/utils/embeddings.py (no model is loaded)."""
+import numpy as np
+import pytest
+
+from app_utils import embeddings
+
+
+@pytest.fixture
+def service():
+    service = embeddings.EmbeddingService()
+    service.encoded = []
+
+    def encode(texts, model_name=None):
+        service.encoded.extend(texts)
+        return np.ones((len(texts), 4), dtype='float32') * len(service.encoded)
+
+    service.encode = encode
+    service.dimension = lambda model_name=None: 4
+    return service
+
+
+def test_query_is_embedded_as_given_without_a_cache(service):
+    service.encode_query("Who is  ANN?")
+    assert service.encoded == ["Who is  ANN?"]
+
+
+def test_cache_key_is_normalized_but_the_model_sees_the_original(service):
+    service.query_cache_size = 8
+    first = service.encode_query("Who is  ANN?")
+    second = service.encode_query("who is ann?")
+    assert service.encoded == ["Who is  ANN?"]
+    np.testing.assert_array_equal(first, second)
@@ -0,0 +1,185 @@
+"""Tests for app/utils/llm_gateway.py."""
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import openai
+import pytest
+
+from app_utils import llm_gateway
+
+REQUEST = httpx.Request('POST', 'http://llm.test/v1/chat/completions')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_gateway, 'time', types.SimpleNamespace(
+        monotonic=lambda: now[0], perf_counter=time.perf_counter, sleep=lambda seconds: None))
+    return now
+
+
+def _status_error(status, headers=None):
+    response = httpx.Response(status, headers=headers, request=REQUEST)
+    return openai.APIStatusError(f"HTTP {status}", response=response, body=None)
+
+
+def _completion(text):
+    message = types.SimpleNamespace(content=text)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+def _provider(outcomes, **kwargs):
+    """A provider whose upstream answers each attempt with the next of ``outcomes``."""
+    provider = llm_gateway.LLMProvider('test', 'http://llm.test/v1', 'model', retry_base_delay=0, **kwargs)
+    provider.attempts = 0
+
+    def create(client, deadline, request):
+        provider.attempts += 1
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    provider._create = create
+    return provider
+
+
+def test_breaker_opens_after_threshold_consecutive_failures(clock):
+    breaker = llm_gateway.CircuitBreaker(failure_threshold=3, reset_after=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    assert breaker.allow() == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.allow() is False
+    assert breaker.rejected == 1
+    assert breaker.opened == 1
+    assert breaker.retry_after() == 30
+
+
+def test_breaker_lets_one_trial_through_when_half_open(clock):
+    breaker = llm_gateway.CircuitBreaker(failure_threshold=1, reset_after=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.state == 'half_open'
+    assert breaker.allow() == 'half_open'
+    assert breaker.allow() is False
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = llm_gateway.CircuitBreaker(failure_threshold=5, reset_after=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow() == 'half_open'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.opened == 2
+    clock[0] += 29
+    assert breaker.allow() is False
+
+
+def test_trial_without_verdict_lets_another_trial_through(clock):
+    breaker = llm_gateway.CircuitBreaker(failure_threshold=1, reset_after=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow() == 'half_open'
+    breaker.end_trial()
+    assert breaker.allow() == 'half_open'
+
+
+@pytest.mark.parametrize('error', [
+    _status_error(429), _status_error(500), _status_error(503),
+    openai.APIConnectionError(request=REQUEST), httpx.ReadError("reset", request=REQUEST),
+])
+def test_retryable_failures_are_retried(clock, error):
+    provider = _provider([error, _completion(" Paris ")])
+    assert provider.complete([]) == "Paris"
+    assert provider.attempts == 2
+    assert provider.retries == 1
+    assert provider.breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('status', [400, 401, 404, 422])
+def test_client_errors_are_not_retried_or_counted_by_the_breaker(clock, status):
+    provider = _provider([_status_error(status)], breaker_threshold=1)
+    with pytest.raises(llm_gateway.LLMError) as raised:
+        provider.complete([])
+    assert type(raised.value) is llm_gateway.LLMError
+    assert provider.attempts == 1
+    assert provider.breaker.state == 'closed'
+
+
+def test_retry_after_header_sets_the_backoff(clock, monkeypatch):
+    slept = []
+    monkeypatch.setattr(llm_gateway.time, 'sleep', slept.append)
+    provider = _provider([_status_error(429, {'Retry-After': '3'}), _completion("ok")])
+    assert provider.complete([], timeout=60) == "ok"
+    assert slept == [3.0]
+
+
+def test_a_failed_call_counts_once_for_the_breaker(clock):
+    provider = _provider([_status_error(503)] * 6, max_retries=2, breaker_threshold=2)
+    with pytest.raises(llm_gateway.LLMError):
+        provider.complete([])
+    assert provider.attempts == 3
+    assert provider.breaker.state == 'closed'
+
+    with pytest.raises(llm_gateway.LLMError):
+        provider.complete([])
+    assert provider.attempts == 6
+    assert provider.breaker.state == 'open'
+
+    with pytest.raises(llm_gateway.LLMCircuitOpen):
+        provider.complete([])
+    assert provider.attempts == 6
+
+
+class _TrickleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    body = (b'{"id": "c", "object": "chat.completion", "created": 0, "model": "m", "choices": '
+            b'[{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "late"}}]}')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        try:
+            # Every byte arrives well within the read timeout, the whole body does not
+            for byte in self.body:
+                self.wfile.write(bytes([byte]))
+                self.wfile.flush()
+                time.sleep(0.02)
+        except OSError:
+            pass
+
+
+def test_complete_deadline_covers_a_trickling_response():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _TrickleHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    provider = llm_gateway.LLMProvider('test', f"http://127.0.0.1:{server.server_address[1]}/v1", 'm',
+                                       max_retries=0)
+    try:
+        started = time.monotonic()
+        with pytest.raises(llm_gateway.LLMTimeout):
+            provider.complete([{"role": "user", "content": "hi"}], timeout=0.5)
+        assert time.monotonic() - started < 1.5
+        assert provider.timeouts == 1
+    finally:
+        provider.close()
+        server.shutdown()